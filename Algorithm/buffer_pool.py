@@ -0,0 +1,45 @@
+import numpy as np
+
+"""
+    Persistent image buffers for the OpenCV 'dst=' outputs of the frame loop.
+    Every stage asks the pool for its named buffer, the buffer is allocated once and then
+    reused by every frame of the same shape, so in the steady state the loop allocates nothing.
+    A name keeps only its last shape, a new shape (a new search window, for example) replaces it.
+"""
+
+
+class BufferPool:
+
+    def __init__(self):
+        self.buffers = {}
+        self.allocations = 0
+
+    """
+        :param name - the name of the buffer, unique for each stage.
+        :param shape - the shape of the image.
+        :param dtype - the type of the image.
+        :return the buffer of the name, uninitialized.
+    """
+
+    def get(self, name, shape, dtype=np.uint8):
+        shape = tuple(shape)
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype)
+            self.buffers[name] = buffer
+            self.allocations += 1
+        return buffer
+
+    """
+        :return a buffer of the same shape and type as 'image'.
+    """
+
+    def like(self, name, image):
+        return self.get(name, image.shape, image.dtype)
+
+    """
+        :return a single-channel buffer of the size of 'image'.
+    """
+
+    def plane(self, name, image, dtype=np.uint8):
+        return self.get(name, image.shape[:2], dtype)
@@ -0,0 +1,134 @@
+import cv2 as cv
+import numpy as np
+from Profiling.stage_timer import timed
+
+"""
+    The candidate-extraction stage of the sky detection.
+    A single connected-components pass over the thresholded MOG2 mask gives every moving object
+    of the frame as a candidate, instead of one global peak.
+    The candidates are kept in a compact NumPy structured array, sorted by the peak intensity
+    of the blurred mask (the whiter, the faster), and the number of candidates is the 'loudness'
+    of the picture that feeds the 'avg_contours' history.
+"""
+
+CANDIDATE_DTYPE = np.dtype([
+    ('x', np.int32),       # centroid
+    ('y', np.int32),
+    ('left', np.int32),    # bounding box
+    ('top', np.int32),
+    ('width', np.int32),
+    ('height', np.int32),
+    ('area', np.int32),    # number of pixels
+    ('peak', np.uint8),    # peak intensity of the blurred mask
+])
+
+NO_CANDIDATES = np.zeros(0, CANDIDATE_DTYPE)
+
+"""
+    :param thresh - the thresholded (binary) foreground mask.
+    :param gray - the blurred foreground mask, for the peak intensity of each candidate.
+    :param min_area - candidates smaller than this number of pixels are ignored.
+    :param scale - the detection scale of the masks (see Algorithm/detection_scale.py).
+    :param window - the search window (x0, y0, x1, y1) the masks were taken from, or None.
+    :param buffers - an optional BufferPool for the label and foreground images (see buffer_pool.py).
+    :return the candidates array (CANDIDATE_DTYPE) in working frame coordinates, the strongest first.
+"""
+
+
+def extractCandidates(thresh, gray, min_area=1, scale=1.0, window=None, buffers=None):
+    labels = buffers.plane('labels', thresh, np.int32) if buffers else None
+    with timed('connectedComponents'):
+        count, labels, stats, centroids = cv.connectedComponentsWithStats(thresh, labels=labels, connectivity=8)
+    if count <= 1:
+        return NO_CANDIDATES
+
+    # label 0 is the background
+    with timed('candidates.peaks'):
+        foreground = np.greater(labels, 0, out=buffers.plane('foreground', thresh, bool) if buffers else None)
+        # one sort groups the pixels by label, every label is a run of its area in the sorted order
+        order = np.argsort(labels[foreground])
+        starts = np.zeros(count - 1, np.intp)
+        np.cumsum(stats[1:-1, cv.CC_STAT_AREA], out=starts[1:])
+        peaks = np.maximum.reduceat(gray[foreground][order], starts)
+
+    x0, y0 = (window[0], window[1]) if window is not None else (0, 0)
+    candidates = np.empty(count - 1, CANDIDATE_DTYPE)
+    candidates['x'] = centroids[1:, 0] / scale + x0
+    candidates['y'] = centroids[1:, 1] / scale + y0
+    candidates['left'] = stats[1:, cv.CC_STAT_LEFT] / scale + x0
+    candidates['top'] = stats[1:, cv.CC_STAT_TOP] / scale + y0
+    candidates['width'] = stats[1:, cv.CC_STAT_WIDTH] / scale
+    candidates['height'] = stats[1:, cv.CC_STAT_HEIGHT] / scale
+    candidates['area'] = stats[1:, cv.CC_STAT_AREA] / (scale * scale)
+    candidates['peak'] = peaks
+
+    if min_area > 1:
+        candidates = candidates[candidates['area'] >= min_area]
+
+    order = np.lexsort((-candidates['area'], -candidates['peak'].astype(np.int32)))
+    return candidates[order]
+
+
+"""
+    :param candidates - the candidates array of this frame.
+    :param last - the (X,Y) point chosen in the last frame.
+    :param max_distance - the farthest a chosen candidate can move between two frames.
+    :return the index of the candidate nearest to 'last', -1 if there is none close enough.
+"""
+
+
+def nearestCandidate(candidates, last, max_distance=40):
+    if len(candidates) == 0 or last is None:
+        return -1
+
+    distance = np.abs(candidates['x'] - last[0]) + np.abs(candidates['y'] - last[1])
+    index = int(np.argmin(distance))
+    if distance[index] > max_distance:
+        return -1
+    return index
+
+
+"""
+    Chooses the candidate to offer to the user.
+    By default it is the strongest candidate, the user can press 'n' to move to the next one,
+    and the choice is kept between frames by following the nearest candidate to the chosen point.
+
+    :param candidates - the candidates array of this frame.
+    :param selected - the point the user chose, or None.
+    :param state - the state key (by keyboard).
+    :return a tuple (index, selected), index is -1 if there are no candidates.
+"""
+
+
+def chooseCandidate(candidates, selected, state):
+    if len(candidates) == 0:
+        return -1, None
+
+    index = nearestCandidate(candidates, selected)
+    if index == -1:
+        index = 0
+        selected = None
+
+    # 78 = 'N' and 110 = 'n' on the keyboard
+    if state == 78 or state == 110:
+        index = (index + 1) % len(candidates)
+        selected = (int(candidates['x'][index]), int(candidates['y'][index]))
+    elif selected is not None:
+        selected = (int(candidates['x'][index]), int(candidates['y'][index]))
+
+    return index, selected
+
+
+"""
+    Draws the candidates that are not offered as thin rectangles, up to 'limit' of them,
+    into 'hud' (see Algorithm/hud.py).
+"""
+
+
+def drawCandidates(hud, candidates, index, limit=10):
+    for i in range(min(len(candidates), limit)):
+        if i == index:
+            continue
+        c = candidates[i]
+        hud.rectangle((int(c['left']), int(c['top'])),
+                      (int(c['left'] + c['width']), int(c['top'] + c['height'])), (0, 0, 255), thickness=1)
@@ -0,0 +1,73 @@
+import cv2 as cv
+import numpy as np
+from Algorithm.buffer_pool import BufferPool
+
+"""
+    The color detection of the ground mode, any set of named HSV ranges in a single pass.
+    A range is a box in HSV space: a hue interval (it can wrap around 180, for the true red on both
+    ends of the hue circle), a saturation interval and a value interval.
+
+    The lookup table of (H, S, V) -> color bits is separable for boxes: a pixel is inside a box when
+    each of its channels is inside the box's interval. So the 3D table is kept as three 256-entry tables
+    of bits, one per channel, a single cv.LUT over the HSV frame gives the three bit planes, and
+    their AND is the label image: bit i is set where the pixel has color i.
+    The cost is the same for one color or eight, a mask of one color is a bitwise AND of the labels.
+"""
+
+# name: ((hue from, hue to), (saturation from, to), (value from, to)), hue from > hue to wraps around 180
+COLOR_RANGES = {
+    'RED': ((136, 10), (87, 255), (111, 255)),
+    'ORANGE': ((8, 22), (120, 255), (150, 255)),
+    'YELLOW': ((16, 65), (175, 255), (237, 255)),
+}
+
+MAX_COLORS = 8
+
+
+class ColorLUT:
+    """
+        :param colors - the names of COLOR_RANGES, or a dictionary of name: ranges (up to 8 colors).
+    """
+
+    def __init__(self, colors=('RED',)):
+        if not isinstance(colors, dict):
+            unknown = [name for name in colors if name not in COLOR_RANGES]
+            if unknown:
+                raise ValueError(f'Unknown colors: {unknown}')
+            colors = {name: COLOR_RANGES[name] for name in colors}
+        if not 0 < len(colors) <= MAX_COLORS:
+            raise ValueError(f'Between 1 and {MAX_COLORS} colors are supported')
+
+        self.names = list(colors)
+        self.bits = {name: 1 << index for index, name in enumerate(self.names)}
+        self.table = np.zeros((1, 256, 3), np.uint8)
+        values = np.arange(256)
+        for name, ranges in colors.items():
+            for channel, (low, high) in enumerate(ranges):
+                if channel == 0 and low > high:
+                    inside = (values >= low) | (values <= high)
+                else:
+                    inside = (values >= low) & (values <= high)
+                self.table[0, inside, channel] |= self.bits[name]
+        self.buffers = BufferPool()
+
+    """
+        :param hsv - the HSV frame (8-bit).
+        :param dst - an optional output buffer of the frame size.
+        :return the label image, bit i is set where the pixel has the color self.names[i].
+    """
+
+    def label(self, hsv, dst=None):
+        lut = cv.LUT(hsv, self.table, dst=self.buffers.like('lut', hsv))
+        if dst is None:
+            dst = self.buffers.plane('labels', hsv)
+        # the AND of the three bit planes, numpy reads the channels in place
+        np.bitwise_and(lut[..., 0], lut[..., 1], out=dst)
+        return np.bitwise_and(dst, lut[..., 2], out=dst)
+
+    """
+        :return the mask (non-zero where the color is) of one color of the label image.
+    """
+
+    def mask(self, labels, name, dst=None):
+        return cv.bitwise_and(labels, self.bits[name], dst=dst)
@@ -1,8 +1,17 @@
 import cv2 as cv
 import numpy as np
-from numpy import long
-import statistics
 from datetime import datetime
+from Algorithm.rolling_stats import RollingStats
+from Algorithm.tracker_backends import createTracker
+from Profiling.stage_timer import timed
+from Algorithm.search_window import SearchWindow, createBackSub
+from Algorithm.detection_scale import toFrame, boxToFrame, shrink, scaledShape
+from Algorithm.frame_cache import FrameCache
+from Algorithm.buffer_pool import BufferPool
+from Algorithm.hud import Hud
+from Algorithm.color_lut import ColorLUT
+from Algorithm.sky_classifier import SkyClassifier
+from Algorithm.candidates import NO_CANDIDATES, extractCandidates, chooseCandidate, drawCandidates
 
 """
     This class manages the detecting and tracking algorithm in day-light.
@@ -23,34 +32,58 @@ class DayMode:
                   (the default is RED).
 
         :param color - if given 'color', it can detect objects by color in ground mode.
-                  The options are 'RED', 'ORANGE' and 'YELLOW'.
+                  The options are 'RED', 'ORANGE' and 'YELLOW', or a list of them (see color_lut.py),
+                  all the colors are detected in a single pass.
                   If it's empty, it will detect 'RED' colors.
+
+        :param roi - if True, while a target is tracked (or was lost in the last frames)
+                  the detection runs only in a search window around it (see SearchWindow).
+
+        :param detection_scale - the detection stages run on a smaller copy of the frame,
+                  for example 0.25, and the detections are mapped back to the frame (see detection_scale.py).
+
+        :param tracker - the tracker backend, 'CSRT', 'KCF', 'MOSSE', 'TEMPLATE' or 'ADAPTIVE'
+                  (see tracker_backends.py).
+        :param tracker_budget - the per-frame time budget (ms) of the 'ADAPTIVE' tracker.
+
+        :param hud - the overlay the mode draws into (see hud.py), the frame itself is never drawn.
     """
 
-    def __init__(self, color_detection, color=None):
-        self.stat = []
-        self.avg_contours = []
+    def __init__(self, color_detection, color=None, roi=True, detection_scale=1.0, tracker='CSRT',
+                 tracker_budget=15.0, hud=None):
+        self.stat = RollingStats(100)
+        self.avg_contours = RollingStats(100)
         self.tempMaxLoc = (0, 0)
-        self.backSub = cv.createBackgroundSubtractorMOG2(history=20, varThreshold=50, detectShadows=True)
-        self.backSub.setNMixtures(8)
-        self.tracker = cv.legacy_TrackerCSRT.create()
+        self.candidates = NO_CANDIDATES
+        self.selected = None
+        self.backSub = createBackSub()
+        self.search = SearchWindow() if roi else None
+        self.detection_scale = detection_scale
+        self.tracker_backend = tracker
+        self.tracker_budget = tracker_budget
+        self.tracker = createTracker(self.tracker_backend, self.tracker_budget)
         self.target_flag = False
         self.frame = None
         self.bbox = None
+        self.cache = None
+        self.buffers = BufferPool()
+        self.hud = hud if hud is not None else Hud()
+        self.classifier = SkyClassifier()
         self.last_mode = None
         self.position = None
         self.color_detection = color_detection
         self.color = color
         self.cancel_msg = 0
+        # True when a detection is offered for tracking in this frame
+        self.detected = False
         self.mode_msg = 0
 
-        # Set range for red color
-        self.red_lower = np.array([136, 87, 111], np.uint8)
-        self.red_upper = np.array([180, 255, 255], np.uint8)
-
-        # Set range for yellow color
-        self.yellow_lower = np.array([16, 175, 237], np.uint8)
-        self.yellow_upper = np.array([65, 255, 255], np.uint8)
+        # The HSV ranges of the colors (see COLOR_RANGES)
+        if color is None:
+            color = ['RED']
+        elif isinstance(color, str):
+            color = [color]
+        self.colors = ColorLUT(color)
 
         # Morphological Transform, Dilation
         # for each color and bitwise_and operator
@@ -63,44 +96,72 @@ class DayMode:
     
         :param fr - the given frame from the user.
         :param state - the state key (by keyboard) to control the algorithm.
+        :param cache - the FrameCache of this frame (see frame_cache.py), a new one if it's empty.
         :return - the (X,Y) position of the tracked object. 
                   If it's not tracking, it will return (-1, -1).
     """
 
-    def dayAction(self, fr, state) -> tuple:
+    def dayAction(self, fr, state, cache=None) -> tuple:
         self.frame = fr
+        self.detected = False
+        self.cache = cache if cache is not None else FrameCache(fr)
 
         if self.skyModeCheck():
-            cv.putText(self.frame, "Sky Mode", (5, 20), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
+            self.hud.putText("Sky Mode", (5, 20), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
             self.position = self.skyMode(state)
         elif self.color_detection:
-            cv.putText(self.frame, "Ground Mode", (5, 20), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
+            self.hud.putText("Ground Mode", (5, 20), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
             self.position = self.groundModeByColor(state)
         else:  # ground without color mode:
-            cv.putText(self.frame, "Ground Mode", (5, 20), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
+            self.hud.putText("Ground Mode", (5, 20), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
             self.position = self.groundMode(state)
 
+        if self.search:
+            self.search.update(self.bbox if self.position[0] != -1 else None)
+
+        return self.position
+
+    """
+        Tracks the locked target without the detection stage (and without the sky/ground check),
+        the scheduler uses it in the frames between two detections.
+
+        :return a tuple (X,Y) of the position of the tracked object.
+    """
+
+    def trackOnly(self, fr) -> tuple:
+        self.frame = fr
+        self.detected = False
+        label = "Sky Mode" if self.last_mode == 'sky' else "Ground Mode"
+        self.hud.putText(label, (5, 20), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
+
+        with timed('tracker.update'):
+            success, box = self.tracker.update(self.frame)
+        self.position = (-1, -1)
+        if self.target_flag and success:
+            self.bbox = (box[0], box[1], box[0] + box[2], box[1] + box[3])
+            self.position = (box[0] + int(box[2] / 2), box[1] + int(box[3] / 2))
+        else:
+            self.tracker = createTracker(self.tracker_backend, self.tracker_budget)
+            self.target_flag = False
+            if self.cancel_msg == 1:
+                self.cancel_msg = 2
+                print(f'\t\tLost contact at {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}')
+
+        if self.search:
+            self.search.update(self.bbox if self.position[0] != -1 else None)
         return self.position
 
     """
         This method decides using color range if the frame is at ground or sky mode.
+        The dark pixels (HSV value up to 155) of a sparse sample are counted every few frames,
+        with hysteresis and a minimal dwell time, so the mode doesn't flip near the threshold (see SkyClassifier).
         
         :return True if it's sky mode.
     """
 
     def skyModeCheck(self) -> bool:
-        hsv = cv.cvtColor(self.frame, cv.COLOR_BGR2HSV)
-
-        # Set range for blue color for moving to sky mode
-        # define mask
-        lower_blue = np.array([0, 0, 0])
-        upper_blue = np.array([179, 255, 155])
-
-        mask = cv.inRange(hsv, lower_blue, upper_blue)
-        mean = mask.mean()
-        if mean < 20.0:
-            return True
-        return False
+        with timed('skyModeCheck'):
+            return self.classifier.isSky(self.frame)
 
     """
         This method manages the detection and tracking of an object in the sky.
@@ -130,6 +191,7 @@ class DayMode:
            The user can press:
                 - 'space' to track a detected object.
                 - 'c' to cancel the tracking and move to detection scenario.
+                - 'n' to offer the next detected candidate.
                 
         The transition from sky to ground (and vice-versa) is safe while we track an object even though the two 
         algorithms are completely different, it is a safe-change between algorithms without losing the object.
@@ -154,29 +216,31 @@ class DayMode:
 
         self.last_mode = 'sky'
 
-        fgMask = self.backSub.apply(self.frame)
-        fram, thresh = cv.threshold(fgMask, 127, 255, 0)
-        contours, hierarchy = cv.findContours(thresh, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
+        fgMask, window = self.foreground()
+        fram, thresh = cv.threshold(fgMask, 127, 255, 0, dst=self.buffers.like('thresh', fgMask))
+        gray = cv.GaussianBlur(fgMask, (7, 7), 0, dst=self.buffers.like('blur', fgMask))
+        self.candidates = extractCandidates(thresh, gray, scale=self.detection_scale, window=window,
+                                            buffers=self.buffers)
 
-        avg = len(contours)
-        self.avg_contours.append(avg)
+        # the number of objects inside the search window says nothing about the whole picture
+        if window is None:
+            avg = len(self.candidates)
+            self.avg_contours.append(avg)
 
-        gray = cv.GaussianBlur(fgMask, (7, 7), 0)
-        (minVal, maxVal, minLoc, maxLoc) = cv.minMaxLoc(gray)
+        index, self.selected = chooseCandidate(self.candidates, self.selected, state)
+        if index == -1:
+            maxLoc = (0, 0)
+        else:
+            maxLoc = (int(self.candidates['x'][index]), int(self.candidates['y'][index]))
         locMean = (maxLoc[0] + maxLoc[1]) / 2
-        self.stat.append(long(locMean))
-        x = statistics.mean(self.stat)
+        self.stat.append(int(locMean))
+        x = self.stat.mean()
         get_stat = self.statisticallyTarget()
-
-        if len(self.stat) == 100:
-            self.stat.pop(0)
-
-        if len(self.avg_contours) == 100:
-            self.avg_contours.pop(0)
         measure = abs(x - maxLoc[0])
 
         if measure <= get_stat:
-            success, box = self.tracker.update(self.frame)
+            with timed('tracker.update'):
+                success, box = self.tracker.update(self.frame)
             position = None
             if self.target_flag and success:
                 self.bbox = (box[0], box[1], box[0] + box[2], box[1] + box[3])
@@ -184,13 +248,15 @@ class DayMode:
             else:
                 # offers new detection if no selected any for tracking
                 if maxLoc[0] != 0 and maxLoc[1] != 0:
-                    cv.rectangle(self.frame, (maxLoc[0] - 20, maxLoc[1] - 20), (maxLoc[0] + 20, maxLoc[1] + 20),
-                                 (0, 0, 255), thickness=3)
+                    self.detected = True
+                    self.hud.rectangle((maxLoc[0] - 20, maxLoc[1] - 20), (maxLoc[0] + 20, maxLoc[1] + 20),
+                                       (0, 0, 255), thickness=3)
+                    drawCandidates(self.hud, self.candidates, index)
 
                 self.tempMaxLoc = maxLoc
 
             if state == 67 or state == 99 or not success:
-                self.tracker = cv.legacy_TrackerCSRT.create()
+                self.tracker = createTracker(self.tracker_backend, self.tracker_budget)
                 self.target_flag = False
                 if self.cancel_msg == 1:
                     self.cancel_msg = 2
@@ -201,6 +267,7 @@ class DayMode:
                 box = [maxLoc[0] - 20, maxLoc[1] - 20, 40, 40]
                 self.tracker.init(self.frame, box)
                 self.target_flag = True
+                self.selected = None
                 self.cancel_msg = 1
                 print(f'\t\tTracking a new target at {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}')
 
@@ -209,6 +276,20 @@ class DayMode:
 
         return -1, -1
 
+    """
+        Runs the background subtraction of this frame, inside the search window if there is one.
+
+        :return a tuple (fgMask, window), window is None if fgMask covers the whole frame.
+    """
+
+    def foreground(self) -> tuple:
+        if self.search:
+            return self.search.foreground(self.frame, self.backSub, self.statisticallyTarget(), self.detection_scale,
+                                          self.cache)
+        small = self.cache.small(self.detection_scale)
+        with timed('backSub.apply'):
+            return self.backSub.apply(small, fgmask=self.buffers.plane('fgMask', small)), None
+
     """
         This method suggest the size of radius of detecting-search
         using the mean of the history list of the number of moving objects we found
@@ -221,7 +302,7 @@ class DayMode:
         :return an integer value (the radius).
     """
     def statisticallyTarget(self):
-        average = statistics.mean(self.avg_contours)
+        average = self.avg_contours.mean()
         if average >= 1000:
             return 100
         elif average >= 700:
@@ -278,26 +359,47 @@ class DayMode:
             return self.bbox[0] + int(self.bbox[2] / 2), self.bbox[1] + int(self.bbox[3] / 2)
 
         self.last_mode = 'ground'
-        hsvFrame = cv.cvtColor(self.frame, cv.COLOR_BGR2HSV)
-
-        mask = None
-        # a mask allows us to focus only on the parts of the frame that interests us.
-        if self.color is None or self.color == 'RED' or self.color == 'ORANGE':
-            mask = cv.inRange(hsvFrame, self.red_lower, self.red_upper)
-
-        if self.color == 'YELLOW':
-            mask = cv.inRange(hsvFrame, self.yellow_lower, self.yellow_upper)
-
-        mask = cv.dilate(mask, self.kernal)
-
-        # Creating contour to track red color
-        # Using contour detection, we can detect the borders of objects, and therefore, localize them easily.
-        # RETR_TREE, CHAIN_APPROX_SIMPLE are not really matter, it's just a technic of how to extract the info.
-        contours, hierarchy = cv.findContours(mask, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-        contours.sort(key=lambda t: cv.contourArea(t))
-        if contours:
-            x, y, w, h = cv.boundingRect(contours[-1])
-            success, box = self.tracker.update(self.frame)
+        # only the crop of the window, the background model of the window is not used here
+        window = None
+        if self.search:
+            self.search.dropModel()
+            window = self.search.windowRect(self.frame.shape, self.statisticallyTarget())
+        # the HSV image at the detection scale, inside the search window only the window is converted
+        if window is None:
+            hsvFrame = self.cache.hsv(self.detection_scale)
+        else:
+            x0, y0, x1, y1 = window
+            roi = shrink(self.frame[y0:y1, x0:x1], self.detection_scale,
+                         self.buffers.get('colorRoi', scaledShape((y1 - y0, x1 - x0, 3), self.detection_scale)))
+            hsvFrame = cv.cvtColor(roi, cv.COLOR_BGR2HSV, dst=self.buffers.like('colorHsv', roi))
+
+        # one lookup gives the labels of all the colors, bit i is set where the pixel has color i
+        with timed('colorLUT'):
+            labels = self.colors.label(hsvFrame, dst=self.buffers.plane('colorLabels', hsvFrame))
+
+        # the largest object of every color, the largest of them all is offered for tracking
+        largest = None
+        largestArea = 0
+        for name in self.colors.names:
+            # a mask allows us to focus only on the parts of the frame that interests us.
+            mask = self.colors.mask(labels, name, dst=self.buffers.like('colorMask', labels))
+            mask = cv.dilate(mask, self.kernal, dst=self.buffers.like('dilated', labels))
+
+            # Using contour detection, we can detect the borders of objects, and therefore, localize them easily.
+            # RETR_EXTERNAL, CHAIN_APPROX_SIMPLE, only the outer border of each object is needed.
+            with timed('findContours'):
+                contours, hierarchy = cv.findContours(mask, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+            if not contours:
+                continue
+            contour = max(contours, key=cv.contourArea)
+            area = cv.contourArea(contour)
+            if largest is None or area > largestArea:
+                largest, largestArea = contour, area
+
+        if largest is not None:
+            x, y, w, h = boxToFrame(cv.boundingRect(largest), self.detection_scale, window)
+            with timed('tracker.update'):
+                success, box = self.tracker.update(self.frame)
 
             if self.target_flag and success:
                 self.bbox = (box[0], box[1], box[0] + box[2], box[1] + box[3])
@@ -305,11 +407,12 @@ class DayMode:
             else:
                 self.bbox = (x, y, x + w, y + h)
                 if x != 0 and y != 0:
-                    cv.rectangle(self.frame, (x, y), (x + w, y + h), (0, 0, 255), thickness=3)
+                    self.detected = True
+                    self.hud.rectangle((x, y), (x + w, y + h), (0, 0, 255), thickness=3)
                 position = -1, -1
 
             if state == 67 or state == 99 or not success:
-                self.tracker = cv.legacy_TrackerCSRT.create()
+                self.tracker = createTracker(self.tracker_backend, self.tracker_budget)
                 self.target_flag = False
                 if self.cancel_msg == 1:
                     self.cancel_msg = 2
@@ -369,11 +472,13 @@ class DayMode:
 
         self.last_mode = 'ground'
 
-        fgMask = self.backSub.apply(self.frame)
+        fgMask, window = self.foreground()
 
-        gray = cv.GaussianBlur(fgMask, (7, 7), 0)
+        gray = cv.GaussianBlur(fgMask, (7, 7), 0, dst=self.buffers.like('blur', fgMask))
         (minVal, maxVal, minLoc, maxLoc) = cv.minMaxLoc(gray)
-        success, box = self.tracker.update(self.frame)
+        maxLoc = toFrame(maxLoc, self.detection_scale, window) if maxVal > 0 else (0, 0)
+        with timed('tracker.update'):
+            success, box = self.tracker.update(self.frame)
         position = None
         if self.target_flag and success:
             self.bbox = (box[0], box[1], box[0] + box[2], box[1] + box[3])
@@ -381,13 +486,14 @@ class DayMode:
         else:
             # offers new detection if no selected any for tracking
             if maxLoc[0] != 0 and maxLoc[1] != 0:
-                cv.rectangle(self.frame, (maxLoc[0] - 20, maxLoc[1] - 20), (maxLoc[0] + 20, maxLoc[1] + 20),
-                             (0, 0, 255), thickness=3)
+                self.detected = True
+                self.hud.rectangle((maxLoc[0] - 20, maxLoc[1] - 20), (maxLoc[0] + 20, maxLoc[1] + 20),
+                                   (0, 0, 255), thickness=3)
 
             self.tempMaxLoc = maxLoc
 
         if state == 67 or state == 99 or not success:
-            self.tracker = cv.legacy_TrackerCSRT.create()
+            self.tracker = createTracker(self.tracker_backend, self.tracker_budget)
             self.target_flag = False
             if self.cancel_msg == 1:
                 self.cancel_msg = 2
@@ -406,6 +512,46 @@ class DayMode:
 
         return -1, -1
 
+    """
+        :return the mean and the variance of the number of moving objects in the last frames,
+                big values mean the picture is 'loud' by many objects.
+    """
+
+    def getClutter(self) -> tuple:
+        return self.avg_contours.mean(), self.avg_contours.variance()
+
+    """
+        :return the candidates array of the last sky frame (see Algorithm/candidates.py), the strongest first.
+    """
+
+    def getCandidates(self):
+        return self.candidates
+
+    """
+        Starts tracking a given box without a detection, for a target handed over by another
+        camera (see orchestrator.py), the tracker learns the target from this frame.
+
+        :param box - the (x1, y1, x2, y2) box of the target in this frame.
+    """
+
+    def seed(self, fr, box):
+        self.frame = fr
+        x1, y1, x2, y2 = (int(value) for value in box)
+        self.tracker = createTracker(self.tracker_backend, self.tracker_budget)
+        self.tracker.init(self.frame, [x1, y1, x2 - x1, y2 - y1])
+        self.target_flag = True
+        self.bbox = (x1, y1, x2, y2)
+        self.selected = None
+        self.cancel_msg = 1
+        print(f'\t\tTracking a handed-over target at {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}')
+
+    """
+        :return True if a detection was offered for tracking in the last frame (before any lock-on).
+    """
+
+    def hasDetection(self) -> bool:
+        return self.detected
+
     def getFrame(self):
         return self.frame
 
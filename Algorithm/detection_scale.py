@@ -0,0 +1,61 @@
+import cv2 as cv
+
+"""
+    The detection stages (MOG2, blur, contours and components) don't need the full resolution
+    of the working frame, and their cost grows with the number of pixels.
+    These helpers run them on a smaller copy of the image ('scale' of the working frame, for example 0.25)
+    and map the results back to the coordinates of the working frame, which is still used for
+    the tracker, the telescope commands, the recording and the display.
+"""
+
+"""
+    :param image - the working frame, or the search window inside it.
+    :param scale - the detection scale, 1.0 returns the image as is.
+    :param dst - an optional output buffer of scaledShape(image.shape, scale).
+    :return the image for the detection stages.
+"""
+
+
+def shrink(image, scale, dst=None):
+    if scale == 1.0:
+        return image
+    height, width = scaledShape(image.shape, scale)[:2]
+    return cv.resize(image, (width, height), dst=dst, interpolation=cv.INTER_AREA)
+
+
+"""
+    :return the shape of an image of 'shape' resized by 'scale'.
+"""
+
+
+def scaledShape(shape, scale):
+    return (max(int(shape[0] * scale), 1), max(int(shape[1] * scale), 1)) + tuple(shape[2:])
+
+
+"""
+    Maps a point found by the detection stages to the working frame.
+
+    :param point - (X,Y) in the detection image.
+    :param scale - the detection scale.
+    :param window - the search window (x0, y0, x1, y1) the detection image was taken from, or None.
+    :return (X,Y) in the working frame.
+"""
+
+
+def toFrame(point, scale, window=None):
+    x = int(point[0] / scale)
+    y = int(point[1] / scale)
+    if window is not None:
+        x += window[0]
+        y += window[1]
+    return x, y
+
+
+"""
+    Maps a box (x, y, w, h) found by the detection stages to the working frame.
+"""
+
+
+def boxToFrame(box, scale, window=None):
+    x, y = toFrame(box[:2], scale, window)
+    return x, y, int(box[2] / scale), int(box[3] / scale)
@@ -0,0 +1,87 @@
+import cv2 as cv
+from Algorithm.buffer_pool import BufferPool
+from Algorithm.detection_scale import shrink, scaledShape
+
+"""
+    The derived images of one frame (HSV, gray, blurred, downsampled), computed on first use and
+    shared by all the stages of that frame: the night/day check, the sky/ground check and the
+    ground color detection ask the cache instead of converting the frame again.
+
+    ObjectTracking resets the cache with every new frame, the hit and miss counters are kept
+    over the whole run so the duplicate conversions can be counted.
+    The images are written into persistent buffers (see BufferPool), they are valid until the next frame.
+"""
+
+
+class FrameCache:
+
+    def __init__(self, frame=None):
+        self.frame = frame
+        self.images = {}
+        self.buffers = BufferPool()
+        self.hits = 0
+        self.misses = 0
+
+    """
+        Starts a new frame, the images of the last frame are dropped.
+    """
+
+    def reset(self, frame):
+        self.frame = frame
+        self.images.clear()
+
+    """
+        :param key - the name of the derived image.
+        :param compute - a function that computes it from the frame.
+        :return the cached image, computed by 'compute' on the first call of this frame.
+    """
+
+    def get(self, key, compute):
+        image = self.images.get(key)
+        if image is not None:
+            self.hits += 1
+            return image
+        self.misses += 1
+        image = compute()
+        self.images[key] = image
+        return image
+
+    """
+        :return the frame resized by 'scale' (the frame itself for 1.0).
+    """
+
+    def small(self, scale=1.0):
+        if scale == 1.0:
+            return self.frame
+        key = ('small', scale)
+        return self.get(key, lambda: shrink(self.frame, scale,
+                                            self.buffers.get(key, scaledShape(self.frame.shape, scale))))
+
+    def hsv(self, scale=1.0):
+        key = ('hsv', scale)
+        return self.get(key, lambda: self.convert(key, scale, cv.COLOR_BGR2HSV))
+
+    def gray(self, scale=1.0):
+        key = ('gray', scale)
+        return self.get(key, lambda: self.convert(key, scale, cv.COLOR_BGR2GRAY))
+
+    def blurred(self, ksize=(5, 5), scale=1.0):
+        key = ('blur', ksize, scale)
+        return self.get(key, lambda: self.blur(key, ksize, scale))
+
+    def blur(self, key, ksize, scale):
+        small = self.small(scale)
+        return cv.blur(small, ksize, dst=self.buffers.like(key, small))
+
+    def convert(self, key, scale, code):
+        small = self.small(scale)
+        shape = small.shape[:2] if code == cv.COLOR_BGR2GRAY else small.shape
+        return cv.cvtColor(small, code, dst=self.buffers.get(key, shape))
+
+    """
+        :return the hit and miss counters of the cache.
+    """
+
+    def getStats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hits / total if total else 0.0}
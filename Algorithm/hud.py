@@ -0,0 +1,95 @@
+import cv2 as cv
+import numpy as np
+from Algorithm.buffer_pool import BufferPool
+
+"""
+    The overlay (mode labels, boxes, arrows, candidates, zoom inset) of a frame, kept apart from the frame itself.
+    Drawing into the frame changes the pixels the next stages see: the background subtraction learns the
+    labels as a static part of the scene and the tracker learns its own green box, in the same frame
+    or in the next one (the frame buffers are reused).
+
+    So the stages record their drawing calls here instead, with the same arguments as the OpenCV
+    functions but without the image, and the analysis frame stays clean.
+    render() copies the frame into a display buffer and replays the calls onto it, only when the
+    frame is shown or recorded. A disabled HUD (headless runs without recording) records nothing.
+"""
+
+
+class Hud:
+    """
+        :param enabled - if False, the drawing calls are ignored and render() returns the frame itself.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.commands = []
+        self.buffers = BufferPool()
+
+    """
+        Drops the drawing calls of the last frame.
+    """
+
+    def clear(self):
+        self.commands.clear()
+
+    """
+        :param draw - a function of (image, *args, **kwargs) that draws into the image.
+    """
+
+    def record(self, draw, *args, **kwargs):
+        if self.enabled:
+            self.commands.append((draw, args, kwargs))
+
+    def putText(self, *args, **kwargs):
+        self.record(cv.putText, *args, **kwargs)
+
+    def rectangle(self, *args, **kwargs):
+        self.record(cv.rectangle, *args, **kwargs)
+
+    def circle(self, *args, **kwargs):
+        self.record(cv.circle, *args, **kwargs)
+
+    def line(self, *args, **kwargs):
+        self.record(cv.line, *args, **kwargs)
+
+    def arrowedLine(self, *args, **kwargs):
+        self.record(cv.arrowedLine, *args, **kwargs)
+
+    """
+        Shows a zoom of the box at the top-right corner of the frame.
+
+        :param box - the (x1, y1, x2, y2) box to zoom in.
+        :param percent - the zoom, the inset is cut to the frame size.
+    """
+
+    def inset(self, box, percent=300):
+        self.record(self.drawInset, box, percent)
+
+    def drawInset(self, image, box, percent):
+        x, y, w, h = max(int(box[0]), 0), max(int(box[1]), 0), int(box[2]), int(box[3])
+        crop_frame = image[y:h, x:w]
+        if crop_frame.size == 0:
+            return
+        (hc, wc) = image.shape[:2]
+        width = min(int(crop_frame.shape[1] * percent / 100), wc)
+        height = min(int(crop_frame.shape[0] * percent / 100), hc)
+        # the crop is a part of the image it is copied to, so it's resized into a buffer first
+        zoom = self.buffers.get('zoom', (height, width) + image.shape[2:])
+        cv.resize(crop_frame, (width, height), dst=zoom, interpolation=cv.INTER_AREA)
+        image[0:height, wc - width:wc] = zoom
+
+    """
+        :param frame - the clean frame.
+        :param dst - an optional output buffer of the frame shape, a persistent one if it's empty.
+        :return a copy of the frame with the recorded calls drawn on it (the frame itself if disabled).
+    """
+
+    def render(self, frame, dst=None):
+        if not self.enabled:
+            return frame
+        if dst is None:
+            dst = self.buffers.like('display', frame)
+        np.copyto(dst, frame)
+        for draw, args, kwargs in self.commands:
+            draw(dst, *args, **kwargs)
+        return dst
@@ -0,0 +1,319 @@
+import cv2 as cv
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+"""
+    The multi-target tracking engine.
+    Every moving object of the candidates stage (see Algorithm/candidates.py) can become a track,
+    the telescope follows one chosen track while the others are kept up to date, this way the user
+    can move from one object to another in a busy sky (several satellites, balloons and birds).
+
+    The track table is kept as NumPy arrays, one row per track, and every frame is a few vectorized steps:
+        - predict   - a constant-velocity Kalman filter, state (X, Y, VX, VY), for all the tracks at once.
+        - associate - a cost matrix of the Mahalanobis distances between every track and every detection,
+                      gated, and solved by optimal assignment (scipy, an optional dependency),
+                      or by the vectorized greedy assignment below if scipy isn't installed.
+        - correct   - the Kalman update of all the matched tracks at once.
+        - birth     - every unmatched detection starts a new tentative track.
+        - death     - a track that was not matched for 'max_misses' frames is removed
+                      ('tentative_misses' frames for a track that is not confirmed yet).
+    A track is confirmed after 'confirm' matches, only confirmed tracks can be followed.
+"""
+
+# a cost bigger than any gated cost, for the pairs outside the gate
+NO_MATCH = 1e6
+
+
+"""
+    Greedy assignment of a rectangular cost matrix, the NumPy fallback of scipy.optimize.linear_sum_assignment,
+    with the same return value. It is not optimal: the cheapest pair is matched first, the same as sorting
+    all the pairs by cost, so a crossing of two targets can be matched the wrong way where the optimal
+    assignment would not. Install scipy for the optimal one.
+
+    Every round matches all the mutual-best pairs at once (the row's cheapest column whose cheapest row
+    is that row), so the loop runs once per round, usually a few, not once per track.
+    The pairs of NO_MATCH are never matched.
+
+    :param cost - a (rows, cols) cost matrix.
+    :return (row_indices, col_indices) of the assignment, sorted by row.
+"""
+
+
+def greedy(cost):
+    cost = np.array(cost, dtype=np.float64)
+    rows, cols = cost.shape
+    row_indices = []
+    col_indices = []
+    row_range = np.arange(rows)
+    while rows and cols:
+        best_col = np.argmin(cost, axis=1)
+        best_row = np.argmin(cost, axis=0)
+        mutual = (best_row[best_col] == row_range) & (cost[row_range, best_col] < NO_MATCH)
+        if not mutual.any():
+            break
+        matched_rows = row_range[mutual]
+        matched_cols = best_col[mutual]
+        row_indices.append(matched_rows)
+        col_indices.append(matched_cols)
+        cost[matched_rows, :] = np.inf
+        cost[:, matched_cols] = np.inf
+
+    if not row_indices:
+        return np.zeros(0, np.intp), np.zeros(0, np.intp)
+    row_indices = np.concatenate(row_indices)
+    col_indices = np.concatenate(col_indices)
+    order = np.argsort(row_indices)
+    return row_indices[order], col_indices[order]
+
+
+"""
+    :return (row_indices, col_indices) of the optimal assignment by scipy, or the greedy one if it isn't installed.
+"""
+
+
+def assign(cost):
+    if linear_sum_assignment is not None:
+        return linear_sum_assignment(cost)
+    return greedy(cost)
+
+
+class MultiTargetTracker:
+    """
+        :param gate - the largest Mahalanobis distance (in standard deviations) of a match.
+        :param confirm - the number of matches before a track is confirmed.
+        :param max_misses - the number of frames a confirmed track can go unmatched before it is removed.
+        :param tentative_misses - the same for a tentative track, shorter, so the clutter of a busy sky
+                  doesn't fill the table and block the new targets.
+        :param max_tracks - the size limit of the track table, new tracks beyond it are not born.
+        :param process_noise - the acceleration noise of the constant-velocity model (pixels / frame^2).
+        :param measurement_noise - the noise of the detected centers (pixels).
+    """
+
+    def __init__(self, gate=4.0, confirm=3, max_misses=10, tentative_misses=2, max_tracks=64, process_noise=1.0,
+                 measurement_noise=2.0):
+        self.gate = gate
+        self.confirm = confirm
+        self.max_misses = max_misses
+        self.tentative_misses = tentative_misses
+        self.max_tracks = max_tracks
+        self.q = process_noise ** 2
+        self.r = measurement_noise ** 2
+        self.next_id = 1
+        self.followed = None
+
+        # the track table
+        self.ids = np.zeros(0, np.int64)
+        self.state = np.zeros((0, 4))             # X, Y, VX, VY
+        self.covariance = np.zeros((0, 4, 4))
+        self.size = np.zeros((0, 2))              # width, height of the last matched detection
+        self.hits = np.zeros(0, np.int32)
+        self.misses = np.zeros(0, np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    """
+        Moves every track 'dt' frames forward by the constant-velocity model.
+    """
+
+    def predict(self, dt=1.0):
+        if len(self.ids) == 0:
+            return
+        F = np.eye(4)
+        F[0, 2] = F[1, 3] = dt
+        # the discrete white-noise acceleration model
+        Q = np.zeros((4, 4))
+        Q[0, 0] = Q[1, 1] = dt ** 4 / 4
+        Q[0, 2] = Q[2, 0] = Q[1, 3] = Q[3, 1] = dt ** 3 / 2
+        Q[2, 2] = Q[3, 3] = dt ** 2
+        self.state = self.state @ F.T
+        self.covariance = F @ self.covariance @ F.T + self.q * Q
+
+    """
+        One frame of the engine: predict, associate, correct, birth and death.
+
+        :param centers - an (M, 2) array of the detected (X, Y) centers.
+        :param sizes - an (M, 2) array of the detected (width, height), or None.
+        :param dt - the number of frames since the last call.
+        :return the ids of the tracks that were matched in this frame.
+    """
+
+    def step(self, centers, sizes=None, dt=1.0):
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        sizes = np.zeros_like(centers) if sizes is None else np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+        self.predict(dt)
+
+        tracks, detections = self.associate(centers)
+        self.correct(tracks, detections, centers, sizes)
+
+        unmatched = np.ones(len(self.ids), bool)
+        unmatched[tracks] = False
+        self.misses[unmatched] += 1
+
+        matched_ids = self.ids[tracks]
+        limit = np.where(self.hits >= self.confirm, self.max_misses, self.tentative_misses)
+        self.remove(self.misses > limit)
+
+        born = np.ones(len(centers), bool)
+        born[detections] = False
+        self.birth(centers[born], sizes[born])
+        return matched_ids
+
+    """
+        :return (track_indices, detection_indices) of the gated optimal assignment.
+    """
+
+    def associate(self, centers):
+        empty = np.zeros(0, np.intp)
+        if len(self.ids) == 0 or len(centers) == 0:
+            return empty, empty
+
+        # innovation covariance S = H P H' + R, with H selecting (X, Y)
+        S = self.covariance[:, :2, :2] + self.r * np.eye(2)
+        inverse = np.linalg.inv(S)
+        residual = centers[None, :, :] - self.state[:, None, :2]
+        cost = np.sqrt(np.einsum('tdi,tij,tdj->td', residual, inverse, residual))
+        cost[cost > self.gate] = NO_MATCH
+
+        tracks, detections = assign(cost)
+        valid = cost[tracks, detections] < NO_MATCH
+        return tracks[valid], detections[valid]
+
+    """
+        The Kalman update of the matched tracks.
+    """
+
+    def correct(self, tracks, detections, centers, sizes):
+        if len(tracks) == 0:
+            return
+        P = self.covariance[tracks]
+        S = P[:, :2, :2] + self.r * np.eye(2)
+        K = P[:, :, :2] @ np.linalg.inv(S)
+        residual = centers[detections] - self.state[tracks, :2]
+        self.state[tracks] += np.einsum('tij,tj->ti', K, residual)
+        self.covariance[tracks] = P - K @ P[:, :2, :]
+        self.size[tracks] = sizes[detections]
+        self.hits[tracks] += 1
+        self.misses[tracks] = 0
+
+    def birth(self, centers, sizes):
+        count = min(len(centers), self.max_tracks - len(self.ids))
+        if count <= 0:
+            return
+        centers, sizes = centers[:count], sizes[:count]
+
+        state = np.zeros((count, 4))
+        state[:, :2] = centers
+        covariance = np.zeros((count, 4, 4))
+        covariance[:, 0, 0] = covariance[:, 1, 1] = self.r
+        # the velocity of a new track is unknown
+        covariance[:, 2, 2] = covariance[:, 3, 3] = 100.0
+
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + count)])
+        self.next_id += count
+        self.state = np.concatenate([self.state, state])
+        self.covariance = np.concatenate([self.covariance, covariance])
+        self.size = np.concatenate([self.size, sizes])
+        self.hits = np.concatenate([self.hits, np.ones(count, np.int32)])
+        self.misses = np.concatenate([self.misses, np.zeros(count, np.int32)])
+
+    def remove(self, dead):
+        if not dead.any():
+            return
+        if self.followed is not None and self.followed in self.ids[dead]:
+            self.followed = None
+        keep = ~dead
+        self.ids = self.ids[keep]
+        self.state = self.state[keep]
+        self.covariance = self.covariance[keep]
+        self.size = self.size[keep]
+        self.hits = self.hits[keep]
+        self.misses = self.misses[keep]
+
+    """
+        Removes every track.
+    """
+
+    def clear(self):
+        self.remove(np.ones(len(self.ids), bool))
+
+    """
+        :return the ids of the confirmed tracks.
+    """
+
+    def confirmed(self):
+        return self.ids[self.hits >= self.confirm]
+
+    """
+        Follows the confirmed track nearest to a point, for example the target of the mode's tracker.
+
+        :return the id of the followed track, or None if there are no confirmed tracks.
+    """
+
+    def followNearest(self, point):
+        mask = self.hits >= self.confirm
+        if not mask.any():
+            return self.followed
+        distance = np.hypot(self.state[mask, 0] - point[0], self.state[mask, 1] - point[1])
+        self.followed = int(self.ids[mask][np.argmin(distance)])
+        return self.followed
+
+    """
+        Moves the followed track to the next confirmed track (by id).
+
+        :return the id of the followed track, or None if there are no confirmed tracks.
+    """
+
+    def followNext(self):
+        ids = self.confirmed()
+        if len(ids) == 0:
+            self.followed = None
+        elif self.followed is None or self.followed not in ids:
+            self.followed = int(ids[0])
+        else:
+            self.followed = int(ids[(int(np.searchsorted(ids, self.followed)) + 1) % len(ids)])
+        return self.followed
+
+    """
+        :return the (X, Y) position of the followed track, or (-1, -1).
+    """
+
+    def getPosition(self):
+        index = self.index(self.followed)
+        if index == -1:
+            return -1, -1
+        return int(self.state[index, 0]), int(self.state[index, 1])
+
+    """
+        :return the (x1, y1, x2, y2) box of the followed track, or (-1, -1, -1, -1).
+    """
+
+    def getBox(self):
+        index = self.index(self.followed)
+        if index == -1:
+            return -1, -1, -1, -1
+        (x, y), (w, h) = self.state[index, :2], np.maximum(self.size[index], 4)
+        return int(x - w / 2), int(y - h / 2), int(x + w / 2), int(y + h / 2)
+
+    def index(self, track_id):
+        if track_id is None:
+            return -1
+        found = np.nonzero(self.ids == track_id)[0]
+        return int(found[0]) if len(found) else -1
+
+    """
+        Draws the confirmed tracks as small circles with their id, and their velocity as a line,
+        into 'hud' (see Algorithm/hud.py).
+    """
+
+    def draw(self, hud):
+        mask = self.hits >= self.confirm
+        for track_id, (x, y, vx, vy) in zip(self.ids[mask], self.state[mask]):
+            color = (0, 255, 0) if track_id == self.followed else (255, 255, 0)
+            hud.circle((int(x), int(y)), 6, color, 1)
+            hud.line((int(x), int(y)), (int(x + 5 * vx), int(y + 5 * vy)), color, 1)
+            hud.putText(str(track_id), (int(x) + 8, int(y) - 8), cv.FONT_HERSHEY_SIMPLEX, 0.35, color)
@@ -1,7 +1,13 @@
 import cv2 as cv
-from numpy import long
-import statistics
 from datetime import datetime
+from Algorithm.rolling_stats import RollingStats
+from Algorithm.tracker_backends import createTracker
+from Profiling.stage_timer import timed
+from Algorithm.search_window import SearchWindow, createBackSub
+from Algorithm.frame_cache import FrameCache
+from Algorithm.buffer_pool import BufferPool
+from Algorithm.hud import Hud
+from Algorithm.candidates import NO_CANDIDATES, extractCandidates, chooseCandidate, drawCandidates
 
 """
     This class manages the detecting and tracking algorithm in night/space.
@@ -10,28 +16,87 @@ from datetime import datetime
 
 
 class NightMode:
+    """
+        :param roi - if True, while a target is tracked (or was lost in the last frames)
+                  the detection runs only in a search window around it (see SearchWindow).
+
+        :param detection_scale - the detection stages run on a smaller copy of the frame,
+                  for example 0.25, and the detections are mapped back to the frame (see detection_scale.py).
+
+        :param tracker - the tracker backend, 'CSRT', 'KCF', 'MOSSE', 'TEMPLATE' or 'ADAPTIVE'
+                  (see tracker_backends.py).
+        :param tracker_budget - the per-frame time budget (ms) of the 'ADAPTIVE' tracker.
 
-    def __init__(self):
-        self.stat = []
-        self.avg_contours = []
+        :param hud - the overlay the mode draws into (see hud.py), the frame itself is never drawn.
+    """
+
+    def __init__(self, roi=True, detection_scale=1.0, tracker='CSRT',
+                 tracker_budget=15.0, hud=None):
+        self.stat = RollingStats(100)
+        self.avg_contours = RollingStats(100)
         self.tempMaxLoc = (0, 0)
-        self.backSub = cv.createBackgroundSubtractorMOG2(history=20, varThreshold=50, detectShadows=True)
-        self.backSub.setNMixtures(8)
+        self.candidates = NO_CANDIDATES
+        self.selected = None
+        self.backSub = createBackSub()
+        self.search = SearchWindow() if roi else None
+        self.detection_scale = detection_scale
+        self.tracker_backend = tracker
+        self.tracker_budget = tracker_budget
         self.lastMean = 0
-        self.tracker = cv.legacy_TrackerCSRT.create()
+        self.tracker = createTracker(self.tracker_backend, self.tracker_budget)
         self.target_flag = False
         self.frame = None
         self.bbox = None
+        self.cache = None
+        self.buffers = BufferPool()
+        self.hud = hud if hud is not None else Hud()
         self.cancel_msg = 0
+        # True when a detection is offered for tracking in this frame
+        self.detected = False
 
 
     """
+        :param cache - the FrameCache of this frame (see frame_cache.py), a new one if it's empty.
         :return a tuple (X,Y) of the position of the detected/tracked object.
     """
-    def nightAction(self, fr, state) -> tuple:
+    def nightAction(self, fr, state, cache=None) -> tuple:
+        self.frame = fr
+        self.detected = False
+        self.cache = cache if cache is not None else FrameCache(fr)
+        self.hud.putText("Sky Mode", (5, 20), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
+        position = self.skyMode(state)
+        if self.search:
+            self.search.update(self.bbox if position[0] != -1 else None)
+        return position
+
+    """
+        Tracks the locked target without the detection stage, the scheduler uses it
+        in the frames between two detections.
+
+        :return a tuple (X,Y) of the position of the tracked object.
+    """
+
+    def trackOnly(self, fr) -> tuple:
         self.frame = fr
-        cv.putText(self.frame, "Sky Mode", (5, 20), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
-        return self.skyMode(state)
+        self.detected = False
+        self.hud.putText("Sky Mode", (5, 20), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
+
+        with timed('tracker.update'):
+            success, box = self.tracker.update(self.frame)
+        position = (-1, -1)
+        if self.target_flag and success:
+            self.bbox = (box[0], box[1], box[0] + box[2], box[1] + box[3])
+            position = (box[0] + int(box[2] / 2), box[1] + int(box[3] / 2))
+        else:
+            self.tracker = createTracker(self.tracker_backend, self.tracker_budget)
+            self.target_flag = False
+            if self.cancel_msg == 1:
+                self.cancel_msg = 2
+                print(f'\t\tLost contact at {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}')
+
+        if self.search:
+            self.search.update(self.bbox if position[0] != -1 else None)
+        return position
 
     """
         This method manages the detection and tracking of an object in the sky.
@@ -61,6 +126,7 @@ class NightMode:
            The user can press:
                 - 'space' to track a detected object.
                 - 'c' to cancel the tracking and move to detection scenario.
+                - 'n' to offer the next detected candidate.
 
         :param state - the state key (by keyboard) to control the algorithm.
 
@@ -68,32 +134,33 @@ class NightMode:
     """
     def skyMode(self, state) -> tuple:
 
-        fgMask = self.backSub.apply(self.frame)
-
-        fram, thresh = cv.threshold(fgMask, 127, 255, 0)
-        contours, hierarchy = cv.findContours(thresh, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
+        fgMask, window = self.foreground()
+        fram, thresh = cv.threshold(fgMask, 127, 255, 0, dst=self.buffers.like('thresh', fgMask))
+        gray = cv.GaussianBlur(fgMask, (7, 7), 0, dst=self.buffers.like('blur', fgMask))
+        self.candidates = extractCandidates(thresh, gray, scale=self.detection_scale, window=window,
+                                            buffers=self.buffers)
 
-        avg = len(contours)
-        self.avg_contours.append(avg)
+        # the number of objects inside the search window says nothing about the whole picture
+        if window is None:
+            avg = len(self.candidates)
+            self.avg_contours.append(avg)
 
-        gray = cv.GaussianBlur(fgMask, (7, 7), 0)
-        (minVal, maxVal, minLoc, maxLoc) = cv.minMaxLoc(gray)
+        index, self.selected = chooseCandidate(self.candidates, self.selected, state)
+        if index == -1:
+            maxLoc = (0, 0)
+        else:
+            maxLoc = (int(self.candidates['x'][index]), int(self.candidates['y'][index]))
         locMean = (maxLoc[0] + maxLoc[1]) / 2
-        self.stat.append(long(locMean))
-        x = statistics.mean(self.stat)
+        self.stat.append(int(locMean))
+        x = self.stat.mean()
         get_stat = self.statisticallyTarget()
-
-        if len(self.stat) == 100:
-            self.stat.pop(0)
-
-        if len(self.avg_contours) == 100:
-            self.avg_contours.pop(0)
         measure = abs(x - maxLoc[0])
 
         if measure <= get_stat:
             position = None
 
-            success, box = self.tracker.update(self.frame)
+            with timed('tracker.update'):
+                success, box = self.tracker.update(self.frame)
             if self.target_flag and success:
                 self.bbox = (box[0], box[1], box[0] + box[2], box[1] + box[3])
                 position = (box[0] + int(box[2] / 2), box[1] + int(box[3] / 2))
@@ -101,14 +168,16 @@ class NightMode:
 
                 # offers new detection if no selected any for tracking
                 if maxLoc[0] != 0 and maxLoc[1] != 0:
-                    cv.rectangle(self.frame, (maxLoc[0] - 10, maxLoc[1] - 10), (maxLoc[0] +10, maxLoc[1]+10 ),
-                                 (0, 0, 255),
-                                 thickness=3)
+                    self.detected = True
+                    self.hud.rectangle((maxLoc[0] - 10, maxLoc[1] - 10), (maxLoc[0] +10, maxLoc[1]+10 ),
+                                       (0, 0, 255),
+                                       thickness=3)
+                    drawCandidates(self.hud, self.candidates, index)
 
                 self.tempMaxLoc = maxLoc
 
             if state == 67 or state == 99 or not success:
-                self.tracker = cv.legacy_TrackerCSRT.create()
+                self.tracker = createTracker(self.tracker_backend, self.tracker_budget)
                 self.target_flag = False
                 if self.cancel_msg == 1:
                     self.cancel_msg = 2
@@ -118,13 +187,14 @@ class NightMode:
             # 32 = 'Space' on the keyboard
             if state == 32:
 
-                if len(contours) >= 30:
+                if len(self.candidates) >= 30:
                     box = [maxLoc[0] - 10, maxLoc[1] - 10, 20, 20]
                 else:
                     box = [maxLoc[0] - 20, maxLoc[1] - 20, 40, 40]
 
                 self.tracker.init(self.frame, box)
                 self.target_flag = True
+                self.selected = None
                 self.cancel_msg = 1
                 print(f'\t\tTracking a new target at {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}')
 
@@ -133,6 +203,20 @@ class NightMode:
 
         return -1, -1
 
+    """
+        Runs the background subtraction of this frame, inside the search window if there is one.
+
+        :return a tuple (fgMask, window), window is None if fgMask covers the whole frame.
+    """
+
+    def foreground(self) -> tuple:
+        if self.search:
+            return self.search.foreground(self.frame, self.backSub, self.statisticallyTarget(), self.detection_scale,
+                                          self.cache)
+        small = self.cache.small(self.detection_scale)
+        with timed('backSub.apply'):
+            return self.backSub.apply(small, fgmask=self.buffers.plane('fgMask', small)), None
+
     """
         This method suggest the size of radius of detecting-search
         using the mean of the history list of the number of moving objects we found
@@ -146,7 +230,7 @@ class NightMode:
     """
 
     def statisticallyTarget(self):
-        average = statistics.mean(self.avg_contours)
+        average = self.avg_contours.mean()
         if average >= 1000:
             return 100
         elif average >= 700:
@@ -158,6 +242,46 @@ class NightMode:
         else:
             return 700
 
+    """
+        :return the mean and the variance of the number of moving objects in the last frames,
+                big values mean the picture is 'loud' by many objects.
+    """
+
+    def getClutter(self) -> tuple:
+        return self.avg_contours.mean(), self.avg_contours.variance()
+
+    """
+        :return the candidates array of the last sky frame (see Algorithm/candidates.py), the strongest first.
+    """
+
+    def getCandidates(self):
+        return self.candidates
+
+    """
+        Starts tracking a given box without a detection, for a target handed over by another
+        camera (see orchestrator.py), the tracker learns the target from this frame.
+
+        :param box - the (x1, y1, x2, y2) box of the target in this frame.
+    """
+
+    def seed(self, fr, box):
+        self.frame = fr
+        x1, y1, x2, y2 = (int(value) for value in box)
+        self.tracker = createTracker(self.tracker_backend, self.tracker_budget)
+        self.tracker.init(self.frame, [x1, y1, x2 - x1, y2 - y1])
+        self.target_flag = True
+        self.bbox = (x1, y1, x2, y2)
+        self.selected = None
+        self.cancel_msg = 1
+        print(f'\t\tTracking a handed-over target at {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}')
+
+    """
+        :return True if a detection was offered for tracking in the last frame (before any lock-on).
+    """
+
+    def hasDetection(self) -> bool:
+        return self.detected
+
     def getFrame(self):
         return self.frame
 
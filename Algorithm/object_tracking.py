@@ -1,7 +1,12 @@
 import cv2
 from Algorithm.day_detection import DayMode
+from Algorithm.frame_cache import FrameCache
+from Algorithm.hud import Hud
+from Algorithm.multi_target import MultiTargetTracker
 from Algorithm.night_detection import NightMode
+from Algorithm.scheduler import DetectionScheduler
 import numpy as np
+from Profiling.stage_timer import timed
 
 """
     This class manages the whole detecting and tracking algorithm.
@@ -10,7 +15,8 @@ import numpy as np
     Those classes are detecting objects and when the user decides to track any of the suggest,
     it returns the (X,Y) position of the object, this way, the telescope can also track it.
     
-    This class is also responsible to display the graphics and information on the screen.
+    This class is also responsible to display the graphics and information on the screen,
+    they are drawn into a separate layer (see hud.py), the frame the algorithm sees is never drawn.
     Using history of positions, it can suggest by arrows which direction the object moved if it lost.
     And also zooming in to the tracked object if it fully focused by the telescope, this way it can help
     show small objects in space.
@@ -27,11 +33,32 @@ class ObjectTracking:
                   (the default is RED).
 
         :param color - if given 'color', it can detect objects by color in ground mode.
-                  The options are 'RED', 'ORANGE' and 'YELLOW'.
+                  The options are 'RED', 'ORANGE' and 'YELLOW', or a list of them.
                   If it's empty, it will detect 'RED' colors.
+
+        :param roi - if True, while a target is tracked the detection runs only in
+                  a search window around it (see SearchWindow).
+
+        :param detection_scale - the detection stages run on a smaller copy of the frame,
+                  for example 0.25, and the detections are mapped back to the frame.
+
+        :param tracker - the tracker backend of the modes, 'CSRT', 'KCF', 'MOSSE', 'TEMPLATE' or 'ADAPTIVE'.
+        :param tracker_budget - the per-frame time budget (ms) of the 'ADAPTIVE' tracker.
+
+        :param detect_interval - while a target is tracked, the detection stage runs only every
+                  'detect_interval' frames (or when the tracker confidence drops), see DetectionScheduler.
+        :param target_fps - if given, the detection interval adapts to hold this frame rate.
+
+        :param multi_target - if True, every candidate of the sky (and night) detection feeds a
+                  MultiTargetTracker, and the telescope can follow any of its tracks ('f' for the next one).
+                  The search window is turned off, the tracks need the candidates of the whole frame.
+
+        :param hud - if False, the graphics are not recorded at all (headless runs without recording),
+                  render() returns the clean frame.
     """
 
-    def __init__(self, color_detection=None, color=None):
+    def __init__(self, color_detection=None, color=None, roi=True, detection_scale=1.0, tracker='CSRT',
+                 tracker_budget=15.0, detect_interval=1, target_fps=None, multi_target=False, hud=True):
         self.first_frame = True
         self.mode_flag = None
         self.mode = None
@@ -41,6 +68,19 @@ class ObjectTracking:
         self.last_target = None
         self.color_detection = color_detection
         self.color = color
+        self.roi = roi and not multi_target
+        self.detection_scale = detection_scale
+        self.tracker = tracker
+        self.tracker_budget = tracker_budget
+        self.cache = FrameCache()
+        self.hud = Hud(enabled=hud)
+        self.scheduler = None
+        if detect_interval > 1 or target_fps:
+            self.scheduler = DetectionScheduler(interval=detect_interval, target_fps=target_fps)
+        self.targets = MultiTargetTracker() if multi_target else None
+        self.engine_frames = 0
+        self.following = False
+        self.seed_box = None
 
     """
         This method is actually the main method of the whole algorithm.
@@ -56,22 +96,82 @@ class ObjectTracking:
 
     def track(self, fr, state) -> tuple:
         self.frame = fr
+        self.cache.reset(fr)
+        self.hud.clear()
 
         if self.first_frame:
             # If return True, it is night mode, else it is day mode.
             self.mode_flag = self.nightModeCheck()
             self.first_frame = False
 
+        # a target handed over by another camera, the mode tracks it from this frame
+        if self.seed_box is not None:
+            self.mode.seed(self.frame, self.seed_box)
+            self.seed_box = None
+
+        detected = True
+        if self.scheduler and not self.scheduler.shouldDetect(self.mode.target_flag, state):
+            self.position = self.mode.trackOnly(self.frame)
+            detected = False
         # If it is night mode
-        if self.mode_flag:
-            self.position = self.mode.nightAction(self.frame, state)
+        elif self.mode_flag:
+            self.position = self.mode.nightAction(self.frame, state, self.cache)
         else:
-            self.position = self.mode.dayAction(self.frame, state)
+            self.position = self.mode.dayAction(self.frame, state, self.cache)
+
+        if self.targets is not None:
+            with timed('multiTarget'):
+                self.position = self.multiTarget(state, detected)
 
-        self.GUI(state)
+        if self.scheduler:
+            self.scheduler.update(self.mode.target_flag, self.mode.bbox)
+
+        with timed('GUI'):
+            self.GUI(state)
 
         return self.position
 
+    """
+        Feeds the candidates of this frame to the multi-target engine and chooses the position.
+        While the mode's tracker is locked, the engine follows the track nearest to it,
+        else the telescope follows the chosen track of the engine.
+
+        :param state - the state key, 'f' or 'F' moves to the next track and 'c' or 'C' stops following.
+        :param detected - False if the detection was skipped in this frame (see DetectionScheduler).
+        :return the (X,Y) position of the followed object, or (-1, -1).
+    """
+
+    def multiTarget(self, state, detected) -> tuple:
+        self.engine_frames += 1
+        # the ground modes have no candidates, the tracks wait there for the sky
+        if detected and self.getMode() in ('night', 'sky'):
+            candidates = self.mode.getCandidates()
+            self.targets.step(np.stack([candidates['x'], candidates['y']], axis=1),
+                              np.stack([candidates['width'], candidates['height']], axis=1),
+                              dt=self.engine_frames)
+            self.engine_frames = 0
+
+        # 70 = 'F' and 102 = 'f' on the keyboard
+        if state == 70 or state == 102:
+            self.following = self.targets.followNext() is not None
+        # 67 = 'C' and 99 = 'c' on the keyboard
+        elif state == 67 or state == 99:
+            self.following = False
+            self.targets.followed = None
+
+        if self.position[0] != -1:
+            self.following = False
+            self.targets.followNearest(self.position)
+            position = self.position
+        elif self.following:
+            position = self.targets.getPosition()
+            self.following = position[0] != -1
+        else:
+            position = self.position
+
+        self.targets.draw(self.hud)
+        return position
+
     """
         This method decides if it is a night mode or a day mode.
         Using color range, it get the first frame of the program and then
@@ -82,23 +182,139 @@ class ObjectTracking:
 
     def nightModeCheck(self) -> bool:
 
-        blur = cv2.blur(self.frame, (5, 5))
+        blur = self.cache.blurred((5, 5))
         if cv2.mean(blur)[0] > 127:
-            self.mode = DayMode(self.color_detection, self.color)
+            self.mode = DayMode(self.color_detection, self.color, roi=self.roi,
+                                detection_scale=self.detection_scale, tracker=self.tracker,
+                                tracker_budget=self.tracker_budget, hud=self.hud)
             print('Day Mode')
             return False
         else:
-            self.mode = NightMode()
+            self.mode = NightMode(roi=self.roi, detection_scale=self.detection_scale, tracker=self.tracker,
+                                  tracker_budget=self.tracker_budget, hud=self.hud)
             print('Night Mode')
             return True
 
     """
-        :return the frame to the main program.
+        Hands a target over to this tracker, for example from a wide-field camera (see orchestrator.py),
+        the mode's tracker starts on the box with the next frame instead of waiting for a detection.
+
+        :param box - the (x1, y1, x2, y2) box of the target in the next frame.
+    """
+
+    def seed(self, box):
+        self.seed_box = box
+
+    """
+        :return True if the mode's tracker is locked on a target.
+    """
+
+    def isTracking(self) -> bool:
+        return self.mode is not None and self.mode.target_flag
+
+    """
+        :return True if the mode offered a detection in the last frame, the 'space' key tracks it.
+    """
+
+    def hasDetection(self) -> bool:
+        return self.mode is not None and self.mode.hasDetection()
+
+    """
+        :return True if a target is tracked (or followed), the mode offers a detection in this frame,
+                or the multi-target engine has confirmed tracks.
+                The event recording runs while it's True (see Stream/event_recorder.py).
+    """
+
+    def hasTarget(self) -> bool:
+        if self.position is not None and self.position[0] != -1:
+            return True
+        if self.hasDetection():
+            return True
+        return self.targets is not None and len(self.targets.confirmed()) > 0
+
+    """
+        :return the frame to the main program, clean of graphics.
     """
 
     def getFrame(self):
         return self.frame
 
+    """
+        Drops every reference to the last frame (here, in the cache and in the mode),
+        for example before the shared memory of the frame is closed (see Stream/shared_frames.py).
+    """
+
+    def releaseFrame(self):
+        self.frame = None
+        self.cache.reset(None)
+        if self.mode is not None:
+            self.mode.frame = None
+            self.mode.cache = None
+
+    """
+        :return the overlay of this frame, the main program can add its own graphics to it.
+    """
+
+    def getHud(self):
+        return self.hud
+
+    """
+        Composites the graphics of this frame onto a copy of the frame, for the display and the recording.
+        The copy is a persistent buffer, it is valid until the next call.
+
+        :return the frame with its graphics (the frame itself if the HUD is off).
+    """
+
+    def render(self):
+        with timed('hud.render'):
+            return self.hud.render(self.frame)
+
+    """
+        :return the statistics of the detection scheduler (see DetectionScheduler.getStats),
+                or None if every frame runs the detection.
+    """
+
+    def getSchedulerStats(self):
+        if self.scheduler is None:
+            return None
+        return self.scheduler.getStats()
+
+    """
+        :return the hit and miss counters of the derived-image cache (see Algorithm/frame_cache.py).
+    """
+
+    def getCacheStats(self) -> dict:
+        return self.cache.getStats()
+
+    """
+        :return the multi-target engine (see Algorithm/multi_target.py), or None.
+    """
+
+    def getTargets(self):
+        return self.targets
+
+    """
+        :return the current mode, 'night', 'sky' or 'ground' (None before the first frame).
+    """
+
+    def getMode(self):
+        if self.mode is None:
+            return None
+        if self.mode_flag:
+            return 'night'
+        return self.mode.last_mode
+
+    """
+        :return the (x1, y1, x2, y2) box of the tracked object, or (-1, -1, -1, -1).
+    """
+
+    def getBox(self):
+        if self.mode is None:
+            return -1, -1, -1, -1
+        if self.following:
+            return self.targets.getBox()
+        return self.mode.getBox()
+
     """
         This GUI method is responsible to display graphics and data on the screen.
         Using mathematics calculations and frame history it can suggest which direction the object moved 
@@ -118,20 +334,20 @@ class ObjectTracking:
         fY = hc // 2
         if centerX >= 15 and centerY >= 15:
 
-            box = self.mode.getBox()
+            box = self.getBox()
             self.drawBox(box)
             limit = self.checkArrowBound((box[0], box[1]), (box[2], box[3]), (fX, fY))
-            cv2.putText(self.frame, "TRACKING!", (5, 45), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0))
+            self.hud.putText("TRACKING!", (5, 45), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0))
             self.last_target = centerX, centerY
 
             if not limit:
-                cv2.circle(self.frame, (fX, fY), 2, (0, 0, 255), 4)
+                self.hud.circle((fX, fY), 2, (0, 0, 255), 4)
 
                 X = int(centerX + (fX - centerX) * 0.5)
                 Y = int(centerY + (fY - centerY) * 0.5)
                 center = (X, Y)
                 self.last_time_center = center
-                cv2.arrowedLine(self.frame, (fX, fY), center, (0, 0, 255), thickness=2, tipLength=0.2)
+                self.hud.arrowedLine((fX, fY), center, (0, 0, 255), thickness=2, tipLength=0.2)
                 self.suggestDirection(fX, fY, centerX, centerY)
 
                 # if 'z' or 'Z' then zoom in to the object
@@ -139,16 +355,16 @@ class ObjectTracking:
                     self.zoomInObject(box, wc)
 
             else:
-                cv2.putText(self.frame, "ON TARGET!", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
+                self.hud.putText("ON TARGET!", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0))
                 self.zoomInObject(box, wc)
 
         else:
             if self.last_time_center:
-                cv2.arrowedLine(self.frame, (fX, fY), self.last_time_center, (0, 0, 255), thickness=2, tipLength=0.2)
+                self.hud.arrowedLine((fX, fY), self.last_time_center, (0, 0, 255), thickness=2, tipLength=0.2)
                 if self.last_target:
                     self.suggestDirection(fX, fY, self.last_target[0], self.last_target[1])
 
-            cv2.putText(self.frame, "LOST!", (5, 45), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
+            self.hud.putText("LOST!", (5, 45), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
 
     """
         This static method decides if the object is in the center of the screen, 
@@ -169,7 +385,7 @@ class ObjectTracking:
 
     def drawBox(self, box):
         x, y, w, h = int(box[0]), int(box[1]), int(box[2]), int(box[3])
-        cv2.rectangle(self.frame, (x, y), (w, h), (0, 255, 0), 3, 3)
+        self.hud.rectangle((x, y), (w, h), (0, 255, 0), 3, 3)
 
     """
         This method receives the src point (fX,fY) 
@@ -182,28 +398,28 @@ class ObjectTracking:
 
     def suggestDirection(self, fX, fY, centerX, centerY):
         if centerX < fX - 10 and centerY < fY - 10:
-            cv2.putText(self.frame, "Up-Left", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
+            self.hud.putText("Up-Left", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
 
         if centerX < fX and fY - 10 <= centerY < fY + 10:
-            cv2.putText(self.frame, "Left", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
+            self.hud.putText("Left", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
 
         if centerX < fX - 10 and fY + 10 <= centerY:
-            cv2.putText(self.frame, "Down-Left", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
+            self.hud.putText("Down-Left", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
 
         if fX - 10 <= centerX < fX + 10 and fY + 20 <= centerY:
-            cv2.putText(self.frame, "Down", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
+            self.hud.putText("Down", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
 
         if fX - 10 <= centerX < fX + 10 and centerY < fY:
-            cv2.putText(self.frame, "Up", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
+            self.hud.putText("Up", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
 
         if fX + 10 < centerX and fY + 10 < centerY:
-            cv2.putText(self.frame, "Down-Right", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
+            self.hud.putText("Down-Right", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
 
         if fX < centerX and fY - 10 < centerY <= fY + 10:
-            cv2.putText(self.frame, "Right", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
+            self.hud.putText("Right", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
 
         if fX + 10 <= centerX and centerY <= fY - 10:
-            cv2.putText(self.frame, "Up-Right", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
+            self.hud.putText("Up-Right", (5, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255))
 
     """
         This method is useful when the algorithm is tracking after a long distance object
@@ -216,21 +432,5 @@ class ObjectTracking:
     """
 
     def zoomInObject(self, box, wc):
-        x, y, w, h = int(box[0]), int(box[1]), int(box[2]), int(box[3])
-        crop_frame = self.frame[y:h, x:w]
-        scale_percent = 300  # percent of zoom
-        width = int(crop_frame.shape[1] * scale_percent / 100)
-        height = int(crop_frame.shape[0] * scale_percent / 100)
-        dim = (width, height)
-        # resize image
-        resized_frame = cv2.resize(crop_frame, dim, interpolation=cv2.INTER_AREA)
-
-        # create an overlay image. You can use any image
-        foreground = np.ones((height, width, 3), dtype='uint8')
-        alpha = 1
-        # Select the region in the background where we want to add the image and add the images using
-        # cv2.addWeighted()
-        added_image = cv2.addWeighted(resized_frame[0:height, 0:width, :], alpha, foreground[0:height, 0:width, :],
-                                      1 - alpha, 0)
-        # Change the region with the result
-        self.frame[0:height, wc - width:wc + width] = added_image
+        # 300 percent of zoom, the inset is cut from the rendered frame (see Hud.drawInset)
+        self.hud.inset(box, percent=300)
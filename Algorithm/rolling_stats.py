@@ -0,0 +1,66 @@
+"""
+    This class is the limited-data-structure behind the 'stat' and 'avg_contours' history lists
+    of the day and night modes.
+    It is a fixed-size ring buffer that keeps a running sum and a running sum of squares,
+    this way adding a value and getting the mean or the variance costs the same
+    no matter how long the history is.
+"""
+
+
+class RollingStats:
+    """
+        :param size - the number of the last values the history holds.
+    """
+
+    def __init__(self, size=100):
+        self.size = size
+        self.values = [0] * size
+        self.index = 0
+        self.count = 0
+        self.sum = 0
+        self.squares = 0
+
+    """
+        Adds a value to the history, if the history is full the oldest value is replaced.
+    """
+
+    def append(self, value):
+        if self.count == self.size:
+            old = self.values[self.index]
+            self.sum -= old
+            self.squares -= old * old
+        else:
+            self.count += 1
+
+        self.values[self.index] = value
+        self.sum += value
+        self.squares += value * value
+        self.index = (self.index + 1) % self.size
+
+    def __len__(self):
+        return self.count
+
+    """
+        :return the mean of the history, 0 if it's empty.
+    """
+
+    def mean(self):
+        if self.count == 0:
+            return 0
+        return self.sum / self.count
+
+    """
+        :return the (population) variance of the history, 0 if it's empty.
+    """
+
+    def variance(self):
+        if self.count == 0:
+            return 0
+        mean = self.sum / self.count
+        return max(self.squares / self.count - mean * mean, 0)
+
+    def clear(self):
+        self.index = 0
+        self.count = 0
+        self.sum = 0
+        self.squares = 0
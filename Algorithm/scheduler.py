@@ -0,0 +1,147 @@
+import time
+
+"""
+    This class decides, for every frame, if the expensive detection stage (MOG2, blur, contours)
+    has to run, or if the tracker is enough.
+    While the tracker is locked on a target, the detection runs only every N frames, or right away
+    when the tracker confidence drops (a lost target, a jump or a sudden change of the box size),
+    or when the user sends a command.
+    With a target frame rate, N adapts by the measured frame period: it grows while the loop is
+    slower than the target and shrinks back when there is spare time.
+
+    The time (and the number of frames) it takes to reacquire a lost target is kept,
+    so the tradeoff between N and the reacquisition can be tuned.
+"""
+
+
+class DetectionScheduler:
+    """
+        :param interval - the initial N, detection every N frames while tracking.
+        :param target_fps - the frame rate to hold, None keeps N fixed.
+        :param max_interval - the largest N.
+        :param jump - a move of the box center bigger than 'jump' times its size is a confidence drop.
+        :param resize - a change of the box area by more than this factor is a confidence drop.
+    """
+
+    def __init__(self, interval=1, target_fps=None, max_interval=10, jump=1.0, resize=1.5):
+        self.interval = interval
+        self.min_interval = 1
+        self.max_interval = max(max_interval, interval)
+        self.target_period = 1.0 / target_fps if target_fps else None
+        self.jump = jump
+        self.resize = resize
+
+        self.since_detection = 0
+        self.low_confidence = False
+        self.last_box = None
+        self.last_call = None
+        self.period = 0.0
+        self.adapt_countdown = 0
+
+        self.tracking = False
+        self.lost_time = None
+        self.lost_frames = 0
+        self.reacquisitions = 0
+        self.reacquire_total = 0.0
+        self.reacquire_last = None
+        self.reacquire_max = 0.0
+        self.reacquire_last_frames = None
+
+        self.detections = 0
+        self.frames = 0
+
+    """
+        :param tracking - True if the mode is locked on a target.
+        :param state - the state key of this frame, any command needs the detection.
+        :return True if the detection has to run in this frame.
+    """
+
+    def shouldDetect(self, tracking, state) -> bool:
+        self.frames += 1
+        now = time.perf_counter()
+        if self.last_call is not None:
+            period = now - self.last_call
+            self.period = period if self.period == 0.0 else 0.9 * self.period + 0.1 * period
+        self.last_call = now
+        self.adapt()
+
+        detect = (not tracking or state != -1 or self.low_confidence
+                  or self.since_detection + 1 >= self.interval)
+        if detect:
+            self.since_detection = 0
+            self.detections += 1
+        else:
+            self.since_detection += 1
+        return detect
+
+    """
+        Adapts N to the target frame rate, once every few frames so it can settle.
+    """
+
+    def adapt(self):
+        if self.target_period is None or self.period == 0.0:
+            return
+        if self.adapt_countdown > 0:
+            self.adapt_countdown -= 1
+            return
+
+        if self.period > self.target_period and self.interval < self.max_interval:
+            self.interval += 1
+            self.adapt_countdown = 10
+        elif self.period < 0.7 * self.target_period and self.interval > self.min_interval:
+            self.interval -= 1
+            self.adapt_countdown = 10
+
+    """
+        Updates the confidence and the reacquisition time by the result of this frame.
+
+        :param tracking - True if the mode is locked on a target after this frame.
+        :param box - the (x1, y1, x2, y2) box of the target.
+    """
+
+    def update(self, tracking, box):
+        now = time.perf_counter()
+        self.low_confidence = False
+
+        if tracking and box is not None and box[2] > box[0] and box[3] > box[1]:
+            if self.last_box is not None:
+                w, h = box[2] - box[0], box[3] - box[1]
+                lw, lh = self.last_box[2] - self.last_box[0], self.last_box[3] - self.last_box[1]
+                dx = abs((box[0] + box[2]) - (self.last_box[0] + self.last_box[2])) / 2
+                dy = abs((box[1] + box[3]) - (self.last_box[1] + self.last_box[3])) / 2
+                ratio = (w * h) / float(max(lw * lh, 1))
+                if dx > self.jump * max(lw, 1) or dy > self.jump * max(lh, 1) \
+                        or ratio > self.resize or ratio < 1 / self.resize:
+                    self.low_confidence = True
+            self.last_box = box
+        else:
+            self.last_box = None
+
+        if self.tracking and not tracking:
+            self.lost_time = now
+            self.lost_frames = 0
+        elif not tracking and self.lost_time is not None:
+            self.lost_frames += 1
+        elif tracking and not self.tracking and self.lost_time is not None:
+            elapsed = now - self.lost_time
+            self.reacquisitions += 1
+            self.reacquire_total += elapsed
+            self.reacquire_last = elapsed
+            self.reacquire_last_frames = self.lost_frames + 1
+            self.reacquire_max = max(self.reacquire_max, elapsed)
+            self.lost_time = None
+        self.tracking = tracking
+
+    """
+        :return the state of the scheduler and the time-to-reacquire statistics (seconds).
+    """
+
+    def getStats(self) -> dict:
+        return {'interval': self.interval,
+                'frame_period': self.period,
+                'detection_ratio': self.detections / self.frames if self.frames else 0.0,
+                'reacquisitions': self.reacquisitions,
+                'reacquire_last': self.reacquire_last,
+                'reacquire_last_frames': self.reacquire_last_frames,
+                'reacquire_mean': self.reacquire_total / self.reacquisitions if self.reacquisitions else None,
+                'reacquire_max': self.reacquire_max}
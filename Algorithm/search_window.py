@@ -0,0 +1,189 @@
+import cv2 as cv
+from Algorithm.buffer_pool import BufferPool
+from Algorithm.detection_scale import shrink, scaledShape
+from Profiling.stage_timer import timed
+
+"""
+    This class limits the detection stages to a search window (region of interest) around the target.
+    Once a target is tracked, or was lost in the last frames, there is no reason to search for it
+    over the whole frame, so the background subtraction, the blur, the contours and the peak search
+    run only inside a window around the last bounding box.
+
+    The size of the window comes from the radius of statisticallyTarget(), a 'loud' picture gives
+    a small radius and therefore a small window.
+    The window has its own background model, and the full-frame background model is kept alive by
+    updating it only every few frames, this way it is ready when the search goes back to the whole frame.
+    When the window moves or changes its size, its new model starts from the background of the full-frame
+    model under the window, instead of taking the whole window as foreground until it learns it.
+"""
+
+
+def createBackSub():
+    backSub = cv.createBackgroundSubtractorMOG2(history=20, varThreshold=50, detectShadows=True)
+    backSub.setNMixtures(8)
+    return backSub
+
+
+class SearchWindow:
+    """
+        :param factor - the part of the statisticallyTarget() radius used as the half size of the window.
+        :param linger - the number of frames the window is kept after the target is lost.
+        :param refresh - the full-frame background model is updated once every 'refresh' frames.
+        :param step - the half size of the window is rounded to this step, so the window model
+                  is not created again on every small change of the target size.
+    """
+
+    def __init__(self, factor=0.25, linger=30, refresh=10, step=32):
+        self.factor = factor
+        self.linger = linger
+        self.refresh = refresh
+        self.step = step
+        self.center = None
+        # the larger side of the last box of the target
+        self.target_size = 0
+        # True when the window model was created for this window and has not seen a frame yet
+        self.cold = False
+        self.lost_frames = 0
+        self.frame_count = 0
+        self.window = None
+        self.backSub = None
+        self.buffers = BufferPool()
+
+    """
+        Updates the window by the result of the last frame.
+
+        :param bbox - the (x1, y1, x2, y2) box of the tracked object, or None if it isn't tracked.
+    """
+
+    def update(self, bbox):
+        if bbox is not None and bbox[2] > bbox[0] and bbox[3] > bbox[1]:
+            cx = int((bbox[0] + bbox[2]) / 2)
+            cy = int((bbox[1] + bbox[3]) / 2)
+            self.target_size = int(max(bbox[2] - bbox[0], bbox[3] - bbox[1]))
+            self.lost_frames = 0
+
+            # move the window only when the target leaves its inner half,
+            # the window background model doesn't like to be moved.
+            if self.center is None or self.window is None:
+                self.center = (cx, cy)
+            else:
+                x0, y0, x1, y1 = self.window
+                if abs(cx - self.center[0]) > (x1 - x0) // 4 or abs(cy - self.center[1]) > (y1 - y0) // 4:
+                    self.center = (cx, cy)
+        elif self.center is not None:
+            self.lost_frames += 1
+            if self.lost_frames > self.linger:
+                self.reset()
+
+    def active(self) -> bool:
+        return self.center is not None
+
+    def reset(self):
+        self.center = None
+        self.window = None
+        self.backSub = None
+        self.cold = False
+        self.lost_frames = 0
+
+    """
+        The geometry of the window alone, the window model is not touched, for the stages that only
+        crop the frame (the ground color detection).
+
+        :param shape - the shape of the frame.
+        :param radius - the radius of statisticallyTarget().
+        :return the window (x0, y0, x1, y1) in frame coordinates, or None to search the whole frame.
+    """
+
+    def windowRect(self, shape, radius):
+        if self.center is None:
+            return None
+
+        height, width = shape[:2]
+        half = max(2 * self.target_size, int(radius * self.factor))
+        half = -(-half // self.step) * self.step
+        w = min(2 * half, width)
+        h = min(2 * half, height)
+        if w == width and h == height:
+            return None
+
+        x0 = min(max(self.center[0] - w // 2, 0), width - w)
+        y0 = min(max(self.center[1] - h // 2, 0), height - h)
+        return x0, y0, x0 + w, y0 + h
+
+    """
+        Drops the window model, called by the stages that crop the window but don't feed the model
+        (the ground color detection), so the next getWindow() doesn't use a model that missed those frames.
+    """
+
+    def dropModel(self):
+        self.backSub = None
+        self.cold = False
+
+    """
+        The window of the background subtraction, a new window model is created when the window moves.
+
+        :return the window (x0, y0, x1, y1) in frame coordinates, or None to search the whole frame.
+    """
+
+    def getWindow(self, shape, radius):
+        window = self.windowRect(shape, radius)
+        if window is None:
+            return None
+
+        # the model of the window knows the pixels under it, a moved window needs a new one as well
+        if window != self.window or self.backSub is None:
+            self.backSub = createBackSub()
+            self.cold = True
+        self.window = window
+        return window
+
+    """
+        Runs the background subtraction for this frame, inside the window if there is one.
+
+        :param frame - the whole frame.
+        :param backSub - the full-frame background model.
+        :param radius - the radius of statisticallyTarget().
+        :param scale - the detection scale (see Algorithm/detection_scale.py).
+        :param cache - the FrameCache of this frame, for the downsampled frame, or None.
+        :return a tuple (fgMask, window), window is None if fgMask covers the whole frame.
+    """
+
+    def foreground(self, frame, backSub, radius, scale=1.0, cache=None):
+        self.frame_count += 1
+        window = self.getWindow(frame.shape, radius)
+        if window is None or self.frame_count % self.refresh == 0:
+            small = cache.small(scale) if cache else shrink(frame, scale)
+            with timed('backSub.apply' if window is None else 'backSub.refresh'):
+                fgMask = backSub.apply(small, fgmask=self.buffers.plane('fgMask', small))
+            if window is None:
+                return fgMask, None
+
+        x0, y0, x1, y1 = window
+        roi = shrink(frame[y0:y1, x0:x1], scale, self.buffers.get('roi', scaledShape((y1 - y0, x1 - x0, 3), scale)))
+        if self.cold:
+            self.warm(backSub, window, roi, scale)
+        with timed('backSub.apply'):
+            return self.backSub.apply(roi, fgmask=self.buffers.plane('roiMask', roi)), window
+
+    """
+        Starts the new window model from the background of the full-frame model under the window,
+        or from the window itself if the full-frame model has no background yet.
+
+        :param backSub - the full-frame background model.
+        :param window - the new window (x0, y0, x1, y1).
+        :param roi - the window image at the detection scale.
+        :param scale - the detection scale.
+    """
+
+    def warm(self, backSub, window, roi, scale):
+        self.cold = False
+        image = roi
+        background = backSub.getBackgroundImage()
+        if background is not None and background.shape[2:] == roi.shape[2:]:
+            x0, y0, x1, y1 = (int(value * scale) for value in window)
+            crop = background[y0:y1, x0:x1]
+            if crop.size:
+                image = cv.resize(crop, (roi.shape[1], roi.shape[0]), dst=self.buffers.like('warm', roi),
+                                  interpolation=cv.INTER_AREA)
+        with timed('backSub.warm'):
+            self.backSub.apply(image, fgmask=self.buffers.plane('roiMask', roi), learningRate=1)
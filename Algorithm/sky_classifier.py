@@ -0,0 +1,82 @@
+import numpy as np
+
+"""
+    The sky/ground decision of the day mode.
+    The frame is ground when enough of it is dark, the HSV value (the max of B, G and R) is at most 155,
+    and the decision is the mean of that mask (0-255) against a threshold of 20.0.
+
+    Checking the whole frame on every frame is a full HSV pass in the hot path, and near the threshold
+    the mode flips back and forth, and every flip re-initialises the tracker by the sky/ground handoff.
+    So the classifier:
+        - samples a sparse grid of pixels (every 'step' pixels) instead of the whole frame.
+        - runs only every 'interval' frames and keeps its decision in between.
+        - has a hysteresis band around the threshold, a mean inside the band keeps the current mode.
+        - keeps a mode at least 'dwell' frames before it can switch again.
+"""
+
+
+class SkyClassifier:
+    """
+        :param threshold - the mean of the dark mask (0-255) between sky and ground.
+        :param band - the hysteresis, sky needs a mean below threshold - band, ground above threshold + band.
+        :param interval - the classification runs every 'interval' frames.
+        :param dwell - the minimal number of frames between two switches.
+        :param step - the distance (pixels) between two samples of the grid.
+        :param dark - the largest HSV value of a dark pixel.
+    """
+
+    def __init__(self, threshold=20.0, band=5.0, interval=5, dwell=30, step=8, dark=155):
+        self.threshold = threshold
+        self.band = band
+        self.interval = interval
+        self.dwell = dwell
+        self.step = step
+        self.dark = dark
+        self.sky = None
+        self.frames = 0
+        self.since_switch = 0
+        self.switches = 0
+        self.mean = 0.0
+
+    """
+        :return the mean (0-255) of the dark mask of the sampled pixels.
+    """
+
+    def darkMean(self, frame) -> float:
+        sample = frame[self.step // 2::self.step, self.step // 2::self.step]
+        dark = np.count_nonzero(sample.max(axis=2) <= self.dark)
+        return float(dark) * 255.0 / max(sample.shape[0] * sample.shape[1], 1)
+
+    """
+        :param frame - the BGR frame.
+        :return True if it's sky mode.
+    """
+
+    def isSky(self, frame) -> bool:
+        self.frames += 1
+        self.since_switch += 1
+        if self.sky is not None and (self.frames - 1) % self.interval != 0:
+            return self.sky
+
+        self.mean = self.darkMean(frame)
+        if self.sky is None:
+            self.sky = self.mean < self.threshold
+            self.since_switch = 0
+        elif self.since_switch >= self.dwell:
+            if self.sky and self.mean > self.threshold + self.band:
+                self.switch(False)
+            elif not self.sky and self.mean < self.threshold - self.band:
+                self.switch(True)
+        return self.sky
+
+    def switch(self, sky):
+        self.sky = sky
+        self.since_switch = 0
+        self.switches += 1
+
+    """
+        :return the last mean of the dark mask and the number of switches.
+    """
+
+    def getStats(self) -> dict:
+        return {'mean': self.mean, 'sky': self.sky, 'switches': self.switches}
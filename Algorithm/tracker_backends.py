@@ -0,0 +1,159 @@
+import time
+import cv2 as cv
+
+"""
+    The tracker backends of the day and night modes.
+    Every backend has the same init(frame, box) / update(frame) -> (success, box) contract
+    of the OpenCV trackers, this way the modes (and the handoff between sky and ground)
+    don't care which one is used:
+        - 'CSRT'     - accurate, but costly, and its cost grows with the size of the box.
+        - 'KCF'      - faster, good for mid-sized targets.
+        - 'MOSSE'    - the fastest, less robust to changes of scale and light.
+        - 'TEMPLATE' - template matching around the last box, a fallback with no OpenCV-contrib tracker.
+        - 'ADAPTIVE' - starts with the most accurate backend the target size allows, and moves between
+                       CSRT, KCF and MOSSE by the measured tracker.update latency to stay inside a time budget.
+"""
+
+BACKENDS = ('CSRT', 'KCF', 'MOSSE', 'TEMPLATE', 'ADAPTIVE')
+
+
+"""
+    :param name - one of BACKENDS.
+    :param budget_ms - the per-frame time budget of 'ADAPTIVE'.
+    :return a new tracker.
+"""
+
+
+def createTracker(name='CSRT', budget_ms=15.0):
+    if name == 'CSRT':
+        return cv.legacy_TrackerCSRT.create()
+    if name == 'KCF':
+        return cv.legacy_TrackerKCF.create()
+    if name == 'MOSSE':
+        return cv.legacy_TrackerMOSSE.create()
+    if name == 'TEMPLATE':
+        return TemplateTracker()
+    if name == 'ADAPTIVE':
+        return AdaptiveTracker(budget_ms=budget_ms)
+    raise ValueError(f'Unknown tracker backend: {name}')
+
+
+class TemplateTracker:
+    """
+        Tracks by normalized cross-correlation of the first box (in gray) inside a search
+        window around the last box.
+
+        :param margin - the search window is the box grown by 'margin' times its size on each side.
+        :param threshold - below this correlation score the target is lost.
+    """
+
+    def __init__(self, margin=1.0, threshold=0.5):
+        self.margin = margin
+        self.threshold = threshold
+        self.template = None
+        self.box = None
+
+    def init(self, frame, box):
+        x, y, w, h = (int(v) for v in box)
+        height, width = frame.shape[:2]
+        x, y = max(x, 0), max(y, 0)
+        w, h = min(w, width - x), min(h, height - y)
+        if w <= 0 or h <= 0:
+            self.template = None
+            return False
+        self.template = cv.cvtColor(frame[y:y + h, x:x + w], cv.COLOR_BGR2GRAY)
+        self.box = (x, y, w, h)
+        return True
+
+    def update(self, frame):
+        if self.template is None:
+            return False, (0, 0, 0, 0)
+
+        x, y, w, h = self.box
+        height, width = frame.shape[:2]
+        mx, my = int(w * self.margin), int(h * self.margin)
+        x0, y0 = max(x - mx, 0), max(y - my, 0)
+        x1, y1 = min(x + w + mx, width), min(y + h + my, height)
+        if x1 - x0 < w or y1 - y0 < h:
+            return False, self.box
+
+        search = cv.cvtColor(frame[y0:y1, x0:x1], cv.COLOR_BGR2GRAY)
+        scores = cv.matchTemplate(search, self.template, cv.TM_CCOEFF_NORMED)
+        (minVal, maxVal, minLoc, maxLoc) = cv.minMaxLoc(scores)
+        if maxVal < self.threshold:
+            return False, self.box
+
+        self.box = (x0 + maxLoc[0], y0 + maxLoc[1], w, h)
+        return True, self.box
+
+
+class AdaptiveTracker:
+    """
+        Switches between the backends to stay inside a per-frame time budget.
+
+        :param backends - the backends from the most accurate to the fastest.
+        :param budget_ms - the per-frame budget of tracker.update.
+        :param large_area - a box bigger than this part of the frame starts at the second backend,
+                  CSRT is too costly for big targets.
+        :param patience - the number of frames between two switches.
+
+        A backend that was too slow is used again only when the box is at most half the size
+        it was when the backend was left, this way the tracker doesn't bounce between two backends.
+    """
+
+    def __init__(self, backends=('CSRT', 'KCF', 'MOSSE'), budget_ms=15.0, large_area=0.05, patience=15):
+        self.backends = backends
+        self.budget = budget_ms / 1000
+        self.large_area = large_area
+        self.patience = patience
+        self.level = 0
+        self.tracker = None
+        self.latency = 0.0
+        self.frames = 0
+        self.box = None
+        self.slow_area = {}
+
+    def init(self, frame, box):
+        self.slow_area = {}
+        self.level = 0
+        height, width = frame.shape[:2]
+        if box[2] * box[3] > self.large_area * width * height and len(self.backends) > 1:
+            self.slow_area[0] = box[2] * box[3]
+            self.level = 1
+        return self.switch(frame, box)
+
+    def switch(self, frame, box):
+        self.tracker = createTracker(self.backends[self.level])
+        self.latency = 0.0
+        self.frames = 0
+        self.box = tuple(box)
+        return self.tracker.init(frame, self.box)
+
+    def update(self, frame):
+        start = time.perf_counter()
+        success, box = self.tracker.update(frame)
+        latency = time.perf_counter() - start
+
+        self.latency = latency if self.frames == 0 else 0.8 * self.latency + 0.2 * latency
+        self.frames += 1
+        if not success:
+            return success, box
+        self.box = tuple(box)
+
+        if self.frames >= self.patience:
+            area = box[2] * box[3]
+            if self.latency > self.budget and self.level < len(self.backends) - 1:
+                self.slow_area[self.level] = area
+                self.level += 1
+                print(f'\t\tTracker over budget ({self.latency * 1000:.1f} ms), '
+                      f'switching to {self.backends[self.level]}')
+                self.switch(frame, self.box)
+            elif self.latency < self.budget / 2 and self.level > 0 \
+                    and area <= self.slow_area.get(self.level - 1, float('inf')) / 2:
+                self.level -= 1
+                self.switch(frame, self.box)
+
+        return success, box
+
+    def getBackend(self):
+        return self.backends[self.level]
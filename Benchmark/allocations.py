@@ -0,0 +1,160 @@
+import argparse
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Algorithm.object_tracking import ObjectTracking
+from Benchmark import synthetic
+from Benchmark.run_benchmark import SCENARIOS, TRACK_KEY, NO_KEY
+from Stream.frame_reader import FrameReader, LOSSLESS
+from Stream.video_recorder import VideoRecorder
+from main import SpaceTracker
+
+"""
+    Checks that the frame loop doesn't allocate images in the steady state (see Algorithm/buffer_pool.py).
+    The clip is generated and written to a temporary video file before the measure, then the same loop as
+    SpaceTracker.start runs over it: FrameReader.read (recycled buffers), rescaleFrame (the 'working' buffer),
+    ObjectTracking.track, moveTelescope, the HUD render and VideoRecorder.write.
+    Every stage of every frame is traced by tracemalloc, NumPy reports its allocations to tracemalloc,
+    and so do the OpenCV outputs (they are NumPy arrays):
+        - transient - the peak of the memory allocated inside the stage, freed or not.
+        - retained  - the memory still allocated after the stage.
+    The first frames (--warmup) allocate the buffers and are not counted.
+    The internal memory of the OpenCV decoder, encoder, trackers and background models is not seen by tracemalloc.
+    The capture and recording threads run at the same time, what they allocate is counted in the stage it
+    happens to overlap.
+
+    The check fails (exit code 1) if the mean transient allocation of any stage is above --limit of a frame.
+
+    For example:
+        python Benchmark/allocations.py --scenarios stars ground-red --resolution 1920x1080
+"""
+
+STAGES = ('read', 'rescale', 'track', 'moveTelescope', 'render', 'record')
+
+
+"""
+    Writes the synthetic clip of the scenario to a video file, the source of the FrameReader.
+
+    :return the number of frames written.
+"""
+
+
+def writeClip(path, name, width, height, frames, seed):
+    scene, args, color = SCENARIOS[name]
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'), 30.0, (width, height))
+    count = 0
+    for frame, truth in synthetic.clip(scene, width, height, frames, seed, color):
+        out.write(frame)
+        count += 1
+    out.release()
+    return count
+
+
+"""
+    Runs one stage of the loop, its allocations go to 'samples' (a dictionary of lists by stage),
+    nothing is counted if 'samples' is None (the warmup frames).
+
+    :return the return value of the stage.
+"""
+
+
+def traced(samples, stage, step, *args, **kwargs):
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    result = step(*args, **kwargs)
+    current, peak = tracemalloc.get_traced_memory()
+    if samples is not None:
+        samples[stage].append((peak - before, current - before))
+    return result
+
+
+def measure(name, width, height, frames, warmup, seed, tracking_args=None, scale=0.5):
+    scene, args, color = SCENARIOS[name]
+    samples = {stage: [] for stage in STAGES}
+    with tempfile.TemporaryDirectory(prefix='allocations_') as directory:
+        clip_path = os.path.join(directory, 'clip.avi')
+        writeClip(clip_path, name, width, height, warmup + frames, seed)
+
+        # the loop of SpaceTracker.start, without a window and a telescope
+        tracker = SpaceTracker(telescopeEnabled=False, headless=True)
+        tracker.capture = FrameReader(clip_path, policy=LOSSLESS)
+        tracker.live = False
+        tracker.object_tracking = ObjectTracking(**dict(args, **(tracking_args or {})))
+        tracker.hud = tracker.object_tracking.getHud()
+        out = VideoRecorder(os.path.join(directory, 'video.avi'), cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'),
+                            30.0, (int(width * scale), int(height * scale)))
+
+        position = (-1, -1)
+        index = 0
+        tracemalloc.start()
+        while True:
+            counted = samples if index >= warmup else None
+            isTrue, tracker.frame = traced(counted, 'read', tracker.capture.read)
+            if not isTrue:
+                break
+            traced(counted, 'rescale', tracker.rescaleFrame, scale=scale)
+            offered = tracker.object_tracking.hasDetection()
+            key = TRACK_KEY if position[0] == -1 and index % 10 == 9 and offered else NO_KEY
+            position = traced(counted, 'track', tracker.object_tracking.track, tracker.frame, state=key)
+            traced(counted, 'moveTelescope', tracker.moveTelescope, position, key)
+            display = traced(counted, 'render', tracker.object_tracking.render)
+            traced(counted, 'record', out.write, display)
+            index += 1
+        tracemalloc.stop()
+
+        display = None
+        tracker.frame = None
+        tracker.object_tracking.releaseFrame()
+        out.release()
+        tracker.capture.release()
+
+    frame_bytes = width * height * 3
+    results = []
+    for stage in STAGES:
+        transient = [sample[0] for sample in samples[stage]] or [0]
+        retained = [sample[1] for sample in samples[stage]] or [0]
+        mean = sum(transient) / len(transient)
+        results.append({'scenario': name, 'resolution': f'{width}x{height}', 'stage': stage,
+                        'frame_bytes': frame_bytes, 'transient_mean': mean, 'transient_max': max(transient),
+                        'retained_mean': sum(retained) / len(retained), 'frame_ratio': mean / frame_bytes})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the steady-state allocations of the frame loop.')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--resolution', default='1920x1080', help='WIDTHxHEIGHT')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scale', type=float, default=0.5, help='the working frame scale, as in SpaceTracker')
+    parser.add_argument('--detection-scale', type=float, default=1.0)
+    parser.add_argument('--limit', type=float, default=0.05,
+                        help='the largest mean allocation of a stage, a part of a frame')
+    args = parser.parse_args()
+
+    width, height = (int(value) for value in args.resolution.lower().split('x'))
+    print(f"{'scenario':<15}{'resolution':>11}{'stage':>15}{'mean KB':>10}{'max KB':>10}{'kept KB':>10}"
+          f"{'of frame':>10}")
+    failed = False
+    for name in args.scenarios:
+        for result in measure(name, width, height, args.frames, args.warmup, args.seed,
+                              {'detection_scale': args.detection_scale}, args.scale):
+            over = result['frame_ratio'] > args.limit
+            print(f"{result['scenario']:<15}{result['resolution']:>11}{result['stage']:>15}"
+                  f"{result['transient_mean'] / 1024:>10.1f}{result['transient_max'] / 1024:>10.1f}"
+                  f"{result['retained_mean'] / 1024:>10.1f}{result['frame_ratio'] * 100:>9.2f}%"
+                  f"{'  FAIL' if over else ''}")
+            failed = failed or over
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
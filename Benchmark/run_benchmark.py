@@ -0,0 +1,151 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Algorithm.object_tracking import ObjectTracking
+from Algorithm.tracker_backends import BACKENDS
+from Benchmark import synthetic
+from Profiling import stage_timer
+
+"""
+    The benchmark of NightMode and DayMode on synthetic clips (see Benchmark/synthetic.py).
+    Every scenario drives ObjectTracking.track headlessly at several resolutions and reports:
+        - fps          - the frames per second of ObjectTracking.track alone (the clip generation isn't counted).
+        - tracked      - the part of the frames where a position was returned.
+        - error        - the mean distance (pixels) between the returned position and the ground truth.
+        - stages       - the mean cost per frame of every stage (see Profiling/stage_timer.py).
+        - cache        - the hits and misses of the derived-image cache (see Algorithm/frame_cache.py).
+        - scheduler    - the detection ratio and the time to reacquire, with --detect-interval or --target-fps.
+
+    The 'space' key is sent automatically while nothing is tracked and a detection is offered,
+    like 'batch.py --auto-track'.
+
+    For example:
+        python Benchmark/run_benchmark.py --resolutions 640x360 1280x720 --frames 200 --json bench.json
+"""
+
+# name: (scene, ObjectTracking arguments, target color)
+SCENARIOS = {
+    'stars': ('stars', {}, synthetic.RED),
+    'sky': ('sky', {}, synthetic.RED),
+    'ground-red': ('ground', {'color_detection': True, 'color': 'RED'}, synthetic.RED),
+    'ground-yellow': ('ground', {'color_detection': True, 'color': 'YELLOW'}, synthetic.YELLOW),
+    'ground-colors': ('ground', {'color_detection': True, 'color': ['RED', 'ORANGE', 'YELLOW']}, synthetic.YELLOW),
+    'ground-motion': ('ground', {}, synthetic.RED),
+}
+
+RESOLUTIONS = ('640x360', '1280x720', '1920x1080')
+
+# 32 = 'Space' on the keyboard
+TRACK_KEY = 32
+NO_KEY = -1
+
+
+"""
+    Runs one scenario at one resolution.
+
+    :return a dictionary of the results.
+"""
+
+
+def runScenario(name, width, height, frames, seed, auto_track, tracking_args=None):
+    scene, args, color = SCENARIOS[name]
+    args = dict(args, **(tracking_args or {}))
+    object_tracking = ObjectTracking(**args)
+    stage_timer.reset()
+
+    elapsed = 0.0
+    tracked = 0
+    errors = 0.0
+    position = (-1, -1)
+    for index, (frame, truth) in enumerate(synthetic.clip(scene, width, height, frames, seed, color)):
+        key = NO_KEY
+        # only a detection offered in the last frame is tracked, like batch.py
+        if auto_track and position[0] == -1 and index % auto_track == auto_track - 1 and \
+                object_tracking.hasDetection():
+            key = TRACK_KEY
+
+        start = time.perf_counter()
+        position = object_tracking.track(frame, state=key)
+        if object_tracking.getHud().enabled:
+            object_tracking.render()
+        elapsed += time.perf_counter() - start
+
+        if position[0] != -1:
+            tracked += 1
+            errors += math.hypot(position[0] - truth[0], position[1] - truth[1])
+
+    stages = {stage: s['mean_ms'] * s['count'] / frames for stage, s in stage_timer.summary().items()}
+    return {'scenario': name, 'resolution': f'{width}x{height}', 'frames': frames,
+            'fps': frames / elapsed if elapsed > 0 else 0.0,
+            'tracked': tracked / frames,
+            'error': errors / tracked if tracked else float('nan'),
+            'stages_ms': stages,
+            'scheduler': object_tracking.getSchedulerStats(),
+            'cache': object_tracking.getCacheStats()}
+
+
+def printResult(result):
+    print(f"{result['scenario']:<15}{result['resolution']:>11}{result['fps']:>9.1f}"
+          f"{result['tracked'] * 100:>9.0f}%{result['error']:>9.1f}")
+    for stage, cost in sorted(result['stages_ms'].items(), key=lambda item: -item[1]):
+        print(f"{'':<17}{stage:<24}{cost:>9.3f} ms/frame")
+    cache = result['cache']
+    print(f"{'':<17}{'frame cache':<24}{cache['hits']:>9} hits {cache['misses']} misses")
+    scheduler = result['scheduler']
+    if scheduler:
+        reacquire = scheduler['reacquire_mean']
+        print(f"{'':<17}{'detection ratio':<24}{scheduler['detection_ratio']:>9.2f} "
+              f"(N={scheduler['interval']}, reacquire "
+              f"{'-' if reacquire is None else f'{reacquire * 1000:.0f} ms'})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark NightMode and DayMode on synthetic clips.')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--resolutions', nargs='+', default=list(RESOLUTIONS), help='WIDTHxHEIGHT')
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--auto-track', type=int, default=10, help="send 'space' every N frames while lost, 0 never")
+    parser.add_argument('--detection-scale', type=float, default=1.0)
+    parser.add_argument('--tracker', default='CSRT', choices=BACKENDS)
+    parser.add_argument('--tracker-budget', type=float, default=15.0, help="the budget (ms) of the 'ADAPTIVE' tracker")
+    parser.add_argument('--detect-interval', type=int, default=1, help='while tracking, detect every N frames')
+    parser.add_argument('--target-fps', type=float, default=None, help='adapt the detection interval to this fps')
+    parser.add_argument('--no-hud', action='store_true', help="don't draw the graphics, as a headless run")
+    parser.add_argument('--no-roi', action='store_true', help='search the whole frame even while tracking')
+    parser.add_argument('--threads', type=int, default=None, help='the number of OpenCV threads')
+    parser.add_argument('--json', help='save the results to a JSON file')
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+    stage_timer.setEnabled(True)
+    tracking_args = {'detection_scale': args.detection_scale, 'roi': not args.no_roi,
+                     'tracker': args.tracker, 'tracker_budget': args.tracker_budget,
+                     'detect_interval': args.detect_interval, 'target_fps': args.target_fps,
+                     'hud': not args.no_hud}
+
+    print(f"{'scenario':<15}{'resolution':>11}{'fps':>9}{'tracked':>10}{'error':>9}")
+    results = []
+    for name in args.scenarios:
+        for resolution in args.resolutions:
+            width, height = (int(value) for value in resolution.lower().split('x'))
+            result = runScenario(name, width, height, args.frames, args.seed, args.auto_track, tracking_args)
+            printResult(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+
+"""
+    Reproducible synthetic clips for the benchmark, no camera or telescope needed.
+    Every clip is a generator of (frame, (X, Y)) pairs, the second item is the ground-truth
+    center of the target in that frame. The same seed always gives the same clip.
+
+    The scenes are:
+        - 'stars'  - a dark star field with a moving point (night mode).
+        - 'sky'    - a bright sky with a drifting balloon and a few birds (day, sky mode).
+        - 'ground' - a ground scene with a red or yellow target and moving clutter (day, ground mode).
+"""
+
+SCENES = ('stars', 'sky', 'ground')
+
+# BGR colors inside the HSV ranges of DayMode
+RED = (80, 0, 255)
+YELLOW = (0, 230, 255)
+
+
+"""
+    The path of the target, a straight line with a slow sine wobble, from the left part of the
+    frame to the right part of the frame.
+"""
+
+
+def targetPath(index, frames, width, height):
+    t = index / max(frames - 1, 1)
+    x = width * (0.2 + 0.6 * t)
+    y = height * (0.5 + 0.15 * np.sin(2 * np.pi * t))
+    return int(x), int(y)
+
+
+def starsClip(width, height, frames, seed):
+    rng = np.random.default_rng(seed)
+    background = np.full((height, width, 3), 8, np.uint8)
+    count = width * height // 4000
+    xs = rng.integers(0, width, count)
+    ys = rng.integers(0, height, count)
+    levels = rng.integers(80, 200, count)
+    for x, y, level in zip(xs, ys, levels):
+        cv2.circle(background, (int(x), int(y)), 1, (int(level),) * 3, -1)
+
+    radius = max(2, width // 640)
+    for index in range(frames):
+        frame = background.copy()
+        center = targetPath(index, frames, width, height)
+        cv2.circle(frame, center, radius, (255, 255, 255), -1)
+        noise = rng.integers(0, 6, (height, width, 3), dtype=np.uint8)
+        cv2.add(frame, noise, dst=frame)
+        yield frame, center
+
+
+def skyClip(width, height, frames, seed):
+    rng = np.random.default_rng(seed)
+    # a vertical gradient of light blue, bright enough for day and sky modes
+    rows = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    background = np.empty((height, width, 3), np.uint8)
+    background[..., 0] = (250 - 20 * rows).astype(np.uint8)
+    background[..., 1] = (215 - 25 * rows).astype(np.uint8)
+    background[..., 2] = (180 - 30 * rows).astype(np.uint8)
+
+    radius = max(6, width // 120)
+    birds = rng.uniform([0, 0], [width, height * 0.4], (3, 2))
+    velocity = rng.uniform(-3, 3, (3, 2)) * width / 640
+    for index in range(frames):
+        frame = background.copy()
+        for bird in birds + velocity * index:
+            cv2.circle(frame, (int(bird[0]) % width, int(bird[1]) % height), max(2, radius // 4), (60, 60, 60), -1)
+        center = targetPath(index, frames, width, height)
+        cv2.circle(frame, center, radius, (240, 240, 250), -1)
+        cv2.circle(frame, center, radius, (40, 40, 200), max(1, radius // 4))
+        yield frame, center
+
+
+def groundClip(width, height, frames, seed, color=RED):
+    rng = np.random.default_rng(seed)
+    # dark enough for ground mode (V <= 155) and blue enough for day mode (B > 127)
+    background = np.empty((height, width, 3), np.uint8)
+    background[...] = (140, 120, 110)
+    texture = rng.integers(0, 15, (height // 8 + 1, width // 8 + 1, 1), dtype=np.uint8)
+    texture = cv2.resize(texture, (width, height), interpolation=cv2.INTER_NEAREST)
+    cv2.add(background, cv2.merge([texture] * 3), dst=background)
+
+    size = max(8, width // 60)
+    clutter = rng.uniform([0, 0], [width, height], (6, 2))
+    velocity = rng.uniform(-4, 4, (6, 2)) * width / 640
+    for index in range(frames):
+        frame = background.copy()
+        for blob in clutter + velocity * index:
+            x, y = int(blob[0]) % width, int(blob[1]) % height
+            cv2.rectangle(frame, (x, y), (x + size, y + size // 2), (70, 80, 90), -1)
+        center = targetPath(index, frames, width, height)
+        cv2.rectangle(frame, (center[0] - size, center[1] - size), (center[0] + size, center[1] + size), color, -1)
+        yield frame, center
+
+
+"""
+    :param scene - one of SCENES.
+    :param width, height - the resolution of the clip.
+    :param frames - the number of frames.
+    :param seed - the random seed.
+    :param color - the BGR color of the ground target.
+    :return a generator of (frame, (X, Y)).
+"""
+
+
+def clip(scene, width, height, frames=150, seed=0, color=RED):
+    if scene == 'stars':
+        return starsClip(width, height, frames, seed)
+    if scene == 'sky':
+        return skyClip(width, height, frames, seed)
+    if scene == 'ground':
+        return groundClip(width, height, frames, seed, color)
+    raise ValueError(f'Unknown scene: {scene}')
@@ -0,0 +1,206 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+
+"""
+    Per-stage timing of the tracking loop.
+    Every stage of the loop (capture, rescale, MOG2, contours, tracker update, GUI, recording,
+    serial writes...) is wrapped by:
+
+        with timed('backSub.apply'):
+            fgMask = self.backSub.apply(frame)
+
+    and its durations are collected into a log-scale histogram per stage, this way the p50/p95/p99
+    are cheap to keep for long sessions. The summary is printed at exit, and saved as JSON
+    if SPACETRACKER_TIMING_DUMP is set to a file path.
+
+    The timing is off unless SPACETRACKER_TIMING=1 is set in the environment, and it is always off
+    under 'python -O'. When it is off, timed() returns a shared no-op context manager and nothing
+    is measured or stored.
+"""
+
+ENABLED = __debug__ and os.environ.get('SPACETRACKER_TIMING', '0') == '1'
+
+# the bucket bounds in nanoseconds, 8 buckets per doubling from 1 microsecond to about 70 seconds
+BUCKETS_PER_OCTAVE = 8
+BOUNDS = [int(1000 * 2 ** (i / BUCKETS_PER_OCTAVE)) for i in range(26 * BUCKETS_PER_OCTAVE + 1)]
+
+
+class Histogram:
+    """
+        A log-scale histogram of durations, the percentiles are accurate to one bucket (about 9%).
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def add(self, duration):
+        index = bisect.bisect_left(BOUNDS, duration)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += duration
+            if duration > self.max:
+                self.max = duration
+
+    """
+        :param q - the percentile, between 0 and 100.
+        :return the upper bound of the bucket that holds the percentile, in nanoseconds.
+    """
+
+    def percentile(self, q):
+        if self.count == 0:
+            return 0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(BOUNDS[index] if index < len(BOUNDS) else self.max, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        ms = 1e-6
+        return {'count': self.count,
+                'mean_ms': self.total / self.count * ms if self.count else 0.0,
+                'p50_ms': self.percentile(50) * ms,
+                'p95_ms': self.percentile(95) * ms,
+                'p99_ms': self.percentile(99) * ms,
+                'max_ms': self.max * ms}
+
+
+class Timer:
+    """
+        The context manager of one stage.
+    """
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.add(time.perf_counter_ns() - self.start)
+        return False
+
+
+class NullTimer:
+    """
+        The context manager when the timing is off, it does nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+histograms = {}
+histograms_lock = threading.Lock()
+
+
+def histogram(name) -> Histogram:
+    hist = histograms.get(name)
+    if hist is None:
+        with histograms_lock:
+            hist = histograms.setdefault(name, Histogram())
+    return hist
+
+
+"""
+    :param name - the name of the stage.
+    :return a context manager that measures the stage.
+"""
+
+
+def timed(name):
+    if not ENABLED:
+        return NULL_TIMER
+    return Timer(histogram(name))
+
+
+"""
+    Adds a duration that was measured elsewhere (nanoseconds).
+"""
+
+
+def record(name, duration):
+    if ENABLED:
+        histogram(name).add(duration)
+
+
+def summary() -> dict:
+    return {name: hist.summary() for name, hist in sorted(histograms.items())}
+
+
+def printSummary():
+    stats = summary()
+    if not stats:
+        return
+    print(f'{"stage":<24}{"count":>8}{"mean":>10}{"p50":>10}{"p95":>10}{"p99":>10}{"max":>10}  (ms)')
+    for name, s in stats.items():
+        print(f'{name:<24}{s["count"]:>8}{s["mean_ms"]:>10.3f}{s["p50_ms"]:>10.3f}'
+              f'{s["p95_ms"]:>10.3f}{s["p99_ms"]:>10.3f}{s["max_ms"]:>10.3f}')
+
+
+def dump(path):
+    with open(path, 'w') as file:
+        json.dump(summary(), file, indent=2)
+
+
+"""
+    Turns the timing on or off at runtime, for example by the benchmark.
+    The summary is printed (and dumped) at exit as when it is turned on by the environment.
+"""
+
+
+def setEnabled(enabled=True):
+    global ENABLED
+    ENABLED = enabled and __debug__
+    if ENABLED:
+        registerExit()
+
+
+def reset():
+    with histograms_lock:
+        histograms.clear()
+
+
+def atExit():
+    printSummary()
+    path = os.environ.get('SPACETRACKER_TIMING_DUMP')
+    if path:
+        dump(path)
+
+
+"""
+    Registers atExit() once, however many times the timing is turned on.
+"""
+
+
+def registerExit():
+    global exit_registered
+    if not exit_registered:
+        atexit.register(atExit)
+        exit_registered = True
+
+
+exit_registered = False
+if ENABLED:
+    registerExit()
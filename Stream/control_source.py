@@ -0,0 +1,126 @@
+import cv2
+import queue
+import socket
+import sys
+import threading
+
+"""
+    Control sources for the SpaceTracker loop.
+    Every source returns, once per frame, a key code in the same format as cv2.waitKey(),
+    this way the algorithm doesn't care if the command came from the keyboard, a script or the network.
+
+    The commands are:
+        - 'track'  - 'space', track a detected object.
+        - 'cancel' - 'c', cancel the tracking and move to detection scenario.
+        - 'zoom'   - 'z', zoom-in to the object.
+        - 'next'   - 'n', offer the next detected candidate.
+        - 'follow' - 'f', follow the next track of the multi-target engine.
+        - 'quit'   - 'q', exit the program.
+"""
+
+NO_KEY = -1
+
+COMMANDS = {
+    'track': 32,
+    'cancel': 99,
+    'zoom': 122,
+    'next': 110,
+    'follow': 102,
+    'quit': 113,
+}
+
+
+def toKey(command) -> int:
+    if isinstance(command, int):
+        return command
+    command = command.strip().lower()
+    if command not in COMMANDS:
+        raise ValueError(f'Unknown command: {command}')
+    return COMMANDS[command]
+
+
+class KeyboardSource:
+    """
+        The classic OpenCV window keyboard, it also paces the loop by 'delay' milliseconds.
+    """
+
+    def __init__(self, delay=30):
+        self.delay = delay
+
+    def poll(self, frame_index) -> int:
+        return cv2.waitKey(self.delay)
+
+    def close(self):
+        pass
+
+
+class ScriptedKeySource:
+    """
+        A timeline of commands by frame index, for example {10: 'track', 250: 'cancel'}.
+        An empty timeline never sends a command.
+    """
+
+    def __init__(self, timeline=None):
+        self.timeline = {int(index): toKey(command) for index, command in (timeline or {}).items()}
+
+    def poll(self, frame_index) -> int:
+        return self.timeline.get(frame_index, NO_KEY)
+
+    def close(self):
+        pass
+
+
+class StreamKeySource:
+    """
+        Reads one command per line from a text stream (stdin by default) in a background thread.
+        Empty lines are skipped, unknown lines are reported and ignored.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdin
+        self.commands = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='StreamKeySource', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        for line in self.stream:
+            if not line.strip():
+                continue
+            try:
+                self.commands.put(toKey(line))
+            except ValueError:
+                print(f'Unknown command: {line.strip()}')
+
+    def poll(self, frame_index) -> int:
+        try:
+            return self.commands.get_nowait()
+        except queue.Empty:
+            return NO_KEY
+
+    def close(self):
+        pass
+
+
+class SocketKeySource:
+    """
+        Receives commands as UDP datagrams, one command per datagram, for example:
+            echo -n track | nc -u -w0 127.0.0.1 5005
+    """
+
+    def __init__(self, host='0.0.0.0', port=5005):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+
+    def poll(self, frame_index) -> int:
+        try:
+            data = self.sock.recv(64)
+        except BlockingIOError:
+            return NO_KEY
+        try:
+            return toKey(data.decode(errors='ignore'))
+        except ValueError:
+            return NO_KEY
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,241 @@
+import collections
+import cv2
+import numpy as np
+import os
+import queue
+import threading
+from datetime import datetime
+
+from Profiling.stage_timer import timed
+from Stream.video_recorder import BLOCK, DROP
+
+"""
+    A recording stage that records only the events, while a target is detected or tracked,
+    instead of every frame of the session (most of a night is empty sky).
+
+    While there is no target, the last 'pre_roll' seconds of frames are kept in a memory ring.
+    When a target appears a new segment file is opened, named by the time of the event, the ring
+    is written first (the seconds before the detection) and then every frame, until 'post_roll'
+    seconds after the target is gone. A long event is split into segments of at most 'segment_seconds'
+    seconds (or 'segment_bytes' bytes), every segment is a complete video file.
+
+    Like VideoRecorder, a writer thread does the encoding and the file operations, the loop only copies
+    the frame into a recycled buffer. The ring buffers are handed to the writer as they are, and the
+    number of buffers is bounded (pre-roll + capacity), so the memory doesn't grow with the events.
+    The policies are BLOCK and DROP (see VideoRecorder).
+"""
+
+OPEN = 'open'
+FRAME = 'frame'
+CLOSE = 'close'
+
+
+class EventRecorder:
+    """
+        :param directory - the directory of the segment files.
+        :param fourcc - the codec of the cv2.VideoWriter.
+        :param fps - the frame rate of the output videos, the frame rate of the source.
+        :param size - (width, height) of the recorded frames.
+        :param pre_roll - the seconds recorded before the target appears.
+        :param post_roll - the seconds recorded after the target is gone.
+        :param segment_seconds - the longest segment in seconds, None for no limit.
+        :param segment_bytes - the largest segment file in bytes, None for no limit.
+        :param capacity - the number of frames in flight to the writer, besides the pre-roll.
+        :param policy - BLOCK or DROP.
+        :param prefix - the start of the segment file names.
+    """
+
+    def __init__(self, directory, fourcc, fps, size, pre_roll=3.0, post_roll=2.0, segment_seconds=300.0,
+                 segment_bytes=None, capacity=32, policy=DROP, prefix='event'):
+        if policy not in (BLOCK, DROP):
+            raise ValueError(f'Unknown event recording policy: {policy}')
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.fourcc = fourcc
+        self.fps = fps
+        self.size = size
+        self.policy = policy
+        self.prefix = prefix
+        self.pre_frames = max(int(round(pre_roll * fps)), 0)
+        self.post_frames = max(int(round(post_roll * fps)), 0)
+        self.segment_frames = int(segment_seconds * fps) if segment_seconds else None
+        self.segment_bytes = segment_bytes
+        # the file size is checked about once a second
+        self.size_interval = max(int(fps), 1)
+        self.limit = self.pre_frames + capacity
+        self.ring = collections.deque()
+        self.free = queue.Queue()
+        self.queue = queue.Queue()
+        self.buffers = 0
+        self.path = None
+        self.length = 0
+        self.idle = 0
+        self.segments = []
+        self.events = 0
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        # the frames outside of the events, and the pre-roll frames lost because all the buffers were with the writer
+        self.idle_frames = 0
+        self.pre_roll_dropped = 0
+        self.thread = threading.Thread(target=self.run, name='EventRecorder', daemon=True)
+        self.thread.start()
+
+    """
+        The writer thread, it opens, writes and closes the segments until release() sends the None sentinel.
+    """
+
+    def run(self):
+        out = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            kind, value = item
+            if kind == FRAME:
+                with timed('VideoWriter.write'):
+                    out.write(value)
+                self.written += 1
+                self.free.put(value)
+            elif kind == OPEN:
+                out = cv2.VideoWriter(value, self.fourcc, self.fps, self.size)
+            elif out is not None:
+                out.release()
+                out = None
+
+        if out is not None:
+            out.release()
+
+    """
+        :param frame - the frame, it is copied, so the caller can change it after it was handed over.
+        :param active - True while a target is detected or tracked in this frame.
+        :return True if the frame was queued to a segment, False if it was kept in the pre-roll or dropped.
+    """
+
+    def write(self, frame, active) -> bool:
+        self.idle = 0 if active else self.idle + 1
+        if self.path is None and active:
+            self.events += 1
+            self.openSegment()
+            # the seconds before the event, the ring buffers go to the writer as they are
+            while self.ring:
+                self.enqueue(self.ring.popleft())
+        elif self.path is not None and self.idle > self.post_frames:
+            self.closeSegment()
+
+        if self.path is None:
+            self.idle_frames += 1
+            self.keep(frame)
+            return False
+
+        if self.segmentFull():
+            self.closeSegment()
+            self.openSegment()
+
+        buffer = self.takeBuffer(frame)
+        if buffer is None:
+            self.dropped += 1
+            return False
+        np.copyto(buffer, frame)
+        self.enqueue(buffer)
+        return True
+
+    """
+        Copies the frame into the pre-roll ring, over the oldest frame when the ring is full.
+    """
+
+    def keep(self, frame):
+        if self.pre_frames == 0:
+            return
+        if len(self.ring) >= self.pre_frames:
+            buffer = self.ring.popleft()
+            if buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+                buffer = np.empty_like(frame)
+        else:
+            buffer = self.takeBuffer(frame)
+            if buffer is None:
+                # all the buffers are still with the writer, the oldest frame of the ring is given up,
+                # or this frame if the ring is empty
+                self.pre_roll_dropped += 1
+                if not self.ring:
+                    return
+                buffer = self.ring.popleft()
+        np.copyto(buffer, frame)
+        self.ring.append(buffer)
+
+    """
+        :return a free frame buffer, None if there is none and the policy doesn't wait.
+    """
+
+    def takeBuffer(self, frame):
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            if self.buffers < self.limit:
+                self.buffers += 1
+                return np.empty_like(frame)
+            if self.policy != BLOCK:
+                return None
+            buffer = self.free.get()
+
+        if buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+            buffer = np.empty_like(frame)
+        return buffer
+
+    def enqueue(self, buffer):
+        self.queue.put((FRAME, buffer))
+        self.queued += 1
+        self.length += 1
+
+    """
+        :return True if the segment reached its length or its file size.
+    """
+
+    def segmentFull(self) -> bool:
+        if self.segment_frames and self.length >= self.segment_frames:
+            return True
+        if self.segment_bytes and self.length % self.size_interval == 0:
+            try:
+                return os.path.getsize(self.path) >= self.segment_bytes
+            except OSError:
+                return False
+        return False
+
+    """
+        Starts a new segment file, named by the current time and its number.
+    """
+
+    def openSegment(self):
+        name = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
+        # the segment number keeps the names of one session apart
+        self.path = os.path.join(self.directory, f'{self.prefix}_{name}_{len(self.segments):03d}.avi')
+        self.length = 0
+        self.segments.append(self.path)
+        self.queue.put((OPEN, self.path))
+
+    def closeSegment(self):
+        self.queue.put((CLOSE, self.path))
+        self.path = None
+
+    """
+        :return the counters of the recording stage, 'dropped' counts the frames of the events,
+                'idle_frames' the frames outside of them (kept in the pre-roll ring) and 'pre_roll_dropped'
+                the pre-roll frames lost for lack of a free buffer.
+    """
+
+    def getStats(self) -> dict:
+        return {'events': self.events, 'segments': len(self.segments), 'queued': self.queued,
+                'written': self.written, 'dropped': self.dropped, 'idle_frames': self.idle_frames,
+                'pre_roll_dropped': self.pre_roll_dropped, 'pending': self.queue.qsize()}
+
+    """
+        Closes the segment of the current event and waits for the queued frames to be written.
+    """
+
+    def release(self):
+        if self.path is not None:
+            self.closeSegment()
+        self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,169 @@
+import cv2
+import threading
+import collections
+import time
+
+from Profiling.stage_timer import timed
+
+"""
+    This class is a background capture stage for the SpaceTracker loop.
+    A dedicated thread decodes frames from the cv2.VideoCapture and keeps them
+    in a bounded ring buffer, this way the decoding of the next frames overlaps
+    with the detection and tracking of the current one.
+
+    Two policies are supported:
+        - 'drop'  - for live cameras, when the buffer is full the oldest frame is
+                    thrown away, so the tracker always works on the newest frames.
+        - 'block' - for offline files, the capture thread waits until there is room
+                    in the buffer, so no frame is lost.
+
+    Every frame keeps its position in the video (milliseconds) and the time it was decoded
+    (time.monotonic()), they are available after read() as 'timestamp' and 'capture_time'.
+
+    The frame buffers are recycled: the capture thread decodes into a free buffer with
+    cv2.VideoCapture.read(image=...), and a frame returned by read() is valid until the next read(),
+    so in the steady state no frame is allocated (at most capacity + 2 buffers exist).
+"""
+
+DROP_OLDEST = 'drop'
+LOSSLESS = 'block'
+
+
+class FrameReader:
+    """
+        :param video_path - the same source that cv2.VideoCapture receives
+                  (a camera index or a path to a video file).
+
+        :param capacity - the number of decoded frames the ring buffer can hold.
+
+        :param policy - DROP_OLDEST or LOSSLESS. If it's empty, a camera index
+                  gets DROP_OLDEST and a file gets LOSSLESS.
+
+        :param reuse - if True, the frame buffers are recycled (a frame is valid until the next read()),
+                  False allocates a new frame for every read.
+    """
+
+    def __init__(self, video_path, capacity=4, policy=None, reuse=True):
+        if policy is None:
+            policy = DROP_OLDEST if isinstance(video_path, int) else LOSSLESS
+        if policy not in (DROP_OLDEST, LOSSLESS):
+            raise ValueError(f'Unknown frame reader policy: {policy}')
+
+        self.capture = cv2.VideoCapture(video_path)
+        self.capture.set(cv2.CAP_ANY, 0)
+        self.capacity = capacity
+        self.policy = policy
+        self.buffer = collections.deque()
+        self.reuse = reuse
+        self.free = []
+        self.held = None
+        self.condition = threading.Condition()
+        self.running = True
+        self.finished = False
+        self.dropped = 0
+        self.decoded = 0
+        self.timestamp = 0.0
+        self.capture_time = 0.0
+        self.thread = threading.Thread(target=self.run, name='FrameReader', daemon=True)
+        self.thread.start()
+
+    """
+        The capture thread, it reads frames until the source is over or until
+        release() is called.
+    """
+
+    def run(self):
+        while self.running:
+            with self.condition:
+                image = self.free.pop() if self.free else None
+            with timed('capture.read'):
+                isTrue, frame = self.capture.read(image=image)
+            if not isTrue:
+                break
+            item = (frame, self.capture.get(cv2.CAP_PROP_POS_MSEC), time.monotonic())
+
+            with self.condition:
+                if self.policy == LOSSLESS:
+                    while self.running and len(self.buffer) >= self.capacity:
+                        self.condition.wait()
+                elif len(self.buffer) >= self.capacity:
+                    self.recycle(self.buffer.popleft()[0])
+                    self.dropped += 1
+
+                self.buffer.append(item)
+                self.decoded += 1
+                self.condition.notify_all()
+
+        with self.condition:
+            self.finished = True
+            self.condition.notify_all()
+
+    """
+        Same contract as cv2.VideoCapture.read(), it waits for the next buffered frame.
+
+        :return a tuple (isTrue, frame), isTrue is False when the source is over.
+    """
+
+    def read(self):
+        with timed('capture.wait'), self.condition:
+            # the frame of the last read() goes back to the capture thread
+            if self.held is not None:
+                self.recycle(self.held)
+                self.held = None
+
+            while not self.buffer and not self.finished:
+                self.condition.wait()
+
+            if not self.buffer:
+                return False, None
+
+            frame, self.timestamp, self.capture_time = self.buffer.popleft()
+            if self.reuse:
+                self.held = frame
+            self.condition.notify_all()
+            return True, frame
+
+    """
+        Gives a frame buffer back to the capture thread, called with the condition held.
+    """
+
+    def recycle(self, frame):
+        if self.reuse:
+            self.free.append(frame)
+
+    """
+        :return True while there are frames to read.
+    """
+
+    def isOpened(self) -> bool:
+        with self.condition:
+            return bool(self.buffer) or not self.finished
+
+    """
+        :return how full the ring buffer is, between 0.0 and 1.0.
+    """
+
+    def fill(self) -> float:
+        with self.condition:
+            return len(self.buffer) / self.capacity
+
+    def getDropped(self) -> int:
+        return self.dropped
+
+    """
+        :return the frame rate of the source, None if it doesn't report one (some cameras).
+    """
+
+    def getFps(self):
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        return fps if fps > 0 else None
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def release(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+        self.capture.release()
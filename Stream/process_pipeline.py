@@ -0,0 +1,253 @@
+import cv2
+import multiprocessing
+import numpy as np
+import queue
+
+from Algorithm.object_tracking import ObjectTracking
+from Stream.frame_reader import FrameReader
+from Stream.shared_frames import SharedFrameRing
+
+"""
+    The multi-process mode of the SpaceTracker loop, every stage runs in its own process
+    so the Python parts of the stages don't share one GIL:
+
+        capture process  - decodes the frames (with a FrameReader), rescales them into a free slot
+                           of the shared ring and sends the slot index to the tracking process.
+        tracking process - runs ObjectTracking on the slot in place, then draws the graphics into
+                           the same slot (the analysis of the frame is over) and sends the result.
+        main process     - reads the results like frames from a FrameReader, steers the telescope,
+                           records and displays the slot, and gives the slot back to the capture process.
+
+    The pixels are never pickled, they stay in the SharedFrameRing (see shared_frames.py), the queues
+    carry slot indices, the results (a small dictionary per frame) and the control keys.
+    The number of slots bounds the frames in flight, when they are all taken the capture process waits
+    and its FrameReader drops (live camera) or holds (file) the decoded frames by its policy.
+"""
+
+NO_KEY = -1
+
+# the seconds a process waits on a queue before it checks the stop event again
+POLL = 0.5
+
+
+"""
+    :return a tuple (shape, fps), the shape of the working frames of the source (its first frame
+            rescaled by 'scale') and its frame rate, None if it doesn't report one.
+"""
+
+
+def probe(video_path, scale) -> tuple:
+    capture = cv2.VideoCapture(video_path)
+    isTrue, frame = capture.read()
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    if not isTrue:
+        raise ValueError(f'Can not read a frame from {video_path}')
+    shape = (int(frame.shape[0] * scale), int(frame.shape[1] * scale)) + frame.shape[2:]
+    return shape, fps if fps > 0 else None
+
+
+"""
+    :return the next item of the queue, None if the stop event was set while waiting.
+"""
+
+
+def waitFor(source, stop):
+    while True:
+        try:
+            return source.get(timeout=POLL)
+        except queue.Empty:
+            if stop.is_set():
+                return None
+
+
+"""
+    The capture process. It ends with a dictionary of its counters on the 'frames' queue.
+"""
+
+
+def captureProcess(video_path, policy, capacity, spec, free, frames, stop):
+    ring = SharedFrameRing.fromSpec(spec)
+    reader = FrameReader(video_path, capacity=capacity, policy=policy)
+    target = None
+    index = 0
+    try:
+        while not stop.is_set():
+            isTrue, frame = reader.read()
+            if not isTrue:
+                break
+            slot = waitFor(free, stop)
+            if slot is None:
+                break
+
+            target = ring.frame(slot)
+            if frame.shape == target.shape:
+                np.copyto(target, frame)
+            else:
+                cv2.resize(frame, (target.shape[1], target.shape[0]), dst=target, interpolation=cv2.INTER_AREA)
+            frames.put((slot, index, reader.timestamp, reader.capture_time))
+            index += 1
+    finally:
+        frames.put({'dropped': reader.dropped, 'decoded': reader.decoded})
+        if stop.is_set():
+            # nobody reads the queue anymore, the process doesn't wait to flush it
+            frames.cancel_join_thread()
+        reader.release()
+        # the slot view must be gone before the ring is closed
+        target = None
+        ring.close()
+
+
+"""
+    The tracking process. A key of the 'control' queue is applied to the next frame,
+    the end of the capture is forwarded to the 'results' queue.
+"""
+
+
+def trackingProcess(spec, tracking_args, frames, results, control, stop):
+    ring = SharedFrameRing.fromSpec(spec)
+    object_tracking = ObjectTracking(**tracking_args)
+    hud = object_tracking.getHud()
+    frame = None
+    try:
+        while True:
+            item = waitFor(frames, stop)
+            if item is None:
+                break
+            if isinstance(item, dict):
+                results.put(item)
+                break
+
+            slot, index, timestamp, capture_time = item
+            try:
+                key = control.get_nowait()
+            except queue.Empty:
+                key = NO_KEY
+
+            frame = ring.frame(slot)
+            position = object_tracking.track(frame, state=key)
+            box = object_tracking.getBox() if position[0] != -1 else (-1, -1, -1, -1)
+            if hud.enabled:
+                hud.render(frame, dst=frame)
+
+            results.put({'slot': slot, 'index': index, 'timestamp': timestamp, 'capture_time': capture_time,
+                         'position': (int(position[0]), int(position[1])),
+                         'box': tuple(int(value) for value in box), 'mode': object_tracking.getMode(),
+                         'target': object_tracking.hasTarget()})
+    finally:
+        if stop.is_set():
+            results.cancel_join_thread()
+        # the tracker keeps the last slot in its frame references
+        frame = None
+        object_tracking.releaseFrame()
+        ring.close()
+
+
+class ProcessPipeline:
+    """
+        Same contract as FrameReader (read(), isOpened(), release(), 'timestamp' and 'capture_time'),
+        but the frames it returns are already tracked (and drawn if the HUD is on), the result of
+        the last read() is in 'result': its 'position', 'box', 'mode' and 'target' (see ObjectTracking.hasTarget).
+        A frame returned by read() is valid until the next read().
+
+        :param video_path - a camera index or a path to a video file.
+        :param scale - the working frame scale, the same as SpaceTracker.rescaleFrame().
+        :param slots - the number of frames of the shared ring.
+        :param policy - the FrameReader policy of the capture process.
+        :param capacity - the number of decoded frames the FrameReader can prefetch.
+        :param tracking_args - the arguments of the ObjectTracking of the tracking process.
+    """
+
+    def __init__(self, video_path, scale=0.5, slots=8, policy=None, capacity=4, tracking_args=None):
+        shape, self.fps = probe(video_path, scale)
+        self.ring = SharedFrameRing(slots, shape)
+        # the children are started fresh, a fork would copy the locked mutexes of the threads
+        # already running here (the FrameReader, the recorder writers and the OpenCV pool)
+        context = multiprocessing.get_context('spawn')
+        self.free = context.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.frames = context.Queue()
+        self.results = context.Queue()
+        self.control = context.Queue()
+        self.stop = context.Event()
+
+        self.held = None
+        self.result = None
+        self.finished = False
+        self.timestamp = 0.0
+        self.capture_time = 0.0
+        self.dropped = 0
+        self.decoded = 0
+
+        self.capture = context.Process(target=captureProcess, name='SpaceTracker-capture', daemon=True,
+                                       args=(video_path, policy, capacity, self.ring.spec(), self.free,
+                                             self.frames, self.stop))
+        self.tracking = context.Process(target=trackingProcess, name='SpaceTracker-tracking', daemon=True,
+                                        args=(self.ring.spec(), tracking_args or {}, self.frames, self.results,
+                                              self.control, self.stop))
+        self.capture.start()
+        self.tracking.start()
+
+    """
+        Waits for the next tracked frame, the slot of the last one goes back to the capture process.
+
+        :return a tuple (isTrue, frame), isTrue is False when the source is over.
+    """
+
+    def read(self):
+        if self.held is not None:
+            self.free.put(self.held)
+            self.held = None
+
+        while not self.finished:
+            try:
+                item = self.results.get(timeout=POLL)
+            except queue.Empty:
+                # the tracking process died without the end of the capture
+                self.finished = not self.tracking.is_alive()
+                continue
+
+            if 'slot' not in item:
+                self.dropped, self.decoded = item['dropped'], item['decoded']
+                self.finished = True
+                break
+
+            self.held = item['slot']
+            self.result = item
+            self.timestamp = item['timestamp']
+            self.capture_time = item['capture_time']
+            return True, self.ring.frame(self.held)
+
+        return False, None
+
+    """
+        Sends a control key to the tracking process, it is applied to the next frame it tracks.
+    """
+
+    def send(self, key):
+        if key != NO_KEY:
+            self.control.put(key)
+
+    def isOpened(self) -> bool:
+        return not self.finished
+
+    def getShape(self) -> tuple:
+        return self.ring.shape
+
+    def getFps(self):
+        return self.fps
+
+    """
+        Stops the processes and removes the shared ring, the frames of read() are not valid after it,
+        the caller drops them before.
+    """
+
+    def release(self):
+        self.held = None
+        self.stop.set()
+        for process in (self.capture, self.tracking):
+            process.join(timeout=5 * POLL)
+            if process.is_alive():
+                process.terminate()
+        self.ring.close()
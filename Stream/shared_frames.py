@@ -0,0 +1,82 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+"""
+    A ring of frame slots in shared memory, for the processes of the pipeline (see process_pipeline.py).
+    The pixels never go through a queue, a slot is written in place by one process and read in place
+    by the next one, only the slot index (a small integer) is sent between them.
+
+    The ring is created by the main process, the other processes attach to it by its name,
+    every process sees the slots as NumPy arrays of the same shape over the same memory.
+    The order of access is the caller's business: a slot index is owned by one process at a time.
+"""
+
+
+class SharedFrameRing:
+    """
+        :param slots - the number of frames of the ring.
+        :param shape - the shape of one frame, for example (540, 960, 3).
+        :param dtype - the type of the frames.
+        :param name - the name of an existing ring to attach to, a new ring is created if it's empty.
+    """
+
+    def __init__(self, slots, shape, dtype=np.uint8, name=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=self.slots * self.frame_bytes)
+        else:
+            self.memory = attach(name)
+        self.frames = np.ndarray((self.slots,) + self.shape, self.dtype, buffer=self.memory.buf)
+
+    """
+        :return what another process needs to attach to the ring, it can be sent to a child process.
+    """
+
+    def spec(self) -> tuple:
+        return self.slots, self.shape, self.dtype.str, self.memory.name
+
+    @classmethod
+    def fromSpec(cls, spec):
+        slots, shape, dtype, name = spec
+        return cls(slots, shape, dtype, name)
+
+    """
+        :return the frame of the slot, a view of the shared memory.
+    """
+
+    def frame(self, slot):
+        return self.frames[slot]
+
+    """
+        Detaches from the ring, the creator also removes it.
+        The frames returned by frame() must be dropped before it, the memory can't be unmapped while
+        a view of it is alive, it is then left to the process exit, but the block is removed anyway.
+    """
+
+    def close(self):
+        self.frames = None
+        try:
+            self.memory.close()
+        except BufferError:
+            print('SharedFrameRing: a frame of the ring is still in use, it is unmapped at exit')
+        finally:
+            if self.owner:
+                self.memory.unlink()
+
+
+"""
+    Attaches to a shared memory block, only the creator removes it.
+    The child processes of multiprocessing share the resource tracker of the main process,
+    so their registration of the block is the same one, Python 3.13 can skip it ('track').
+"""
+
+
+def attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
@@ -0,0 +1,152 @@
+import cv2
+import numpy as np
+import queue
+import threading
+
+from Profiling.stage_timer import timed
+
+"""
+    This class is an asynchronous recording stage for the SpaceTracker loop.
+    The frames are handed to a dedicated writer thread through a bounded queue,
+    this way the MJPG encoding and the disk stalls don't delay the telescope commands.
+
+    When the queue is full, the overflow policy decides what to do:
+        - 'block'   - wait for the writer, no recorded frame is lost.
+        - 'drop'    - throw the new frame away, the tracking loop never waits.
+        - 'degrade' - lower the MJPG quality while the queue is filling up,
+                      and drop frames only when it is completely full.
+
+    Every queued frame is copied into a recycled buffer (capacity + 1 of them, allocated on first use),
+    so the caller can reuse its frame right away and the recording allocates nothing in the steady state.
+"""
+
+BLOCK = 'block'
+DROP = 'drop'
+DEGRADE = 'degrade'
+
+
+class VideoRecorder:
+    """
+        :param path - the output video file.
+        :param fourcc - the codec of the cv2.VideoWriter.
+        :param fps - the frame rate of the output video.
+        :param size - (width, height) of the recorded frames.
+        :param capacity - the number of frames the queue can hold.
+        :param policy - BLOCK, DROP or DEGRADE.
+        :param quality - the normal MJPG quality (0-100).
+        :param low_quality - the MJPG quality used by DEGRADE while the queue is filling up.
+    """
+
+    def __init__(self, path, fourcc, fps, size, capacity=32, policy=DROP, quality=95, low_quality=50):
+        if policy not in (BLOCK, DROP, DEGRADE):
+            raise ValueError(f'Unknown recording policy: {policy}')
+
+        self.out = cv2.VideoWriter(path, fourcc, fps, size)
+        self.policy = policy
+        self.capacity = capacity
+        self.quality = quality
+        self.low_quality = low_quality
+        self.degraded = False
+        self.queue = queue.Queue(maxsize=capacity)
+        self.free = queue.Queue()
+        self.buffers = 0
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, name='VideoRecorder', daemon=True)
+        self.thread.start()
+
+    """
+        The writer thread, it encodes frames until release() sends the None sentinel.
+    """
+
+    def run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+
+            if self.policy == DEGRADE:
+                self.adjustQuality()
+
+            with timed('VideoWriter.write'):
+                self.out.write(frame)
+            self.written += 1
+            self.free.put(frame)
+
+    """
+        Switches the MJPG quality by the queue level, with a gap between the two
+        levels so it doesn't flip on every frame.
+    """
+
+    def adjustQuality(self):
+        level = self.queue.qsize() / self.capacity
+        if not self.degraded and level >= 0.5:
+            self.degraded = True
+            self.out.set(cv2.VIDEOWRITER_PROP_QUALITY, self.low_quality)
+        elif self.degraded and level <= 0.25:
+            self.degraded = False
+            self.out.set(cv2.VIDEOWRITER_PROP_QUALITY, self.quality)
+
+    """
+        :return a free frame buffer, None if there is none and the policy doesn't wait.
+    """
+
+    def takeBuffer(self, frame):
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            if self.buffers <= self.capacity:
+                self.buffers += 1
+                return np.empty_like(frame)
+            if self.policy != BLOCK:
+                return None
+            buffer = self.free.get()
+
+        if buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+            buffer = np.empty_like(frame)
+        return buffer
+
+    """
+        Same contract as cv2.VideoWriter.write(), the frame is copied,
+        so the caller can change it after it was handed over.
+
+        :return True if the frame was queued, False if it was dropped.
+    """
+
+    def write(self, frame) -> bool:
+        buffer = self.takeBuffer(frame)
+        if buffer is None:
+            self.dropped += 1
+            return False
+        np.copyto(buffer, frame)
+
+        if self.policy == BLOCK:
+            self.queue.put(buffer)
+        else:
+            try:
+                self.queue.put_nowait(buffer)
+            except queue.Full:
+                self.free.put(buffer)
+                self.dropped += 1
+                return False
+
+        self.queued += 1
+        return True
+
+    """
+        :return the counters of the recording stage.
+    """
+
+    def getStats(self) -> dict:
+        return {'queued': self.queued, 'written': self.written, 'dropped': self.dropped,
+                'pending': self.queue.qsize()}
+
+    """
+        Waits for the queued frames to be written and closes the video file.
+    """
+
+    def release(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.out.release()
@@ -14,6 +14,10 @@ import threading as tr
 import time
 import math
 
+from Profiling.stage_timer import timed
+from Telescope import nexstar_protocol as nexstar
+from Telescope.position_poller import PositionPoller
+
 two_inTwentyFour = 16777216
 
 
@@ -46,6 +50,12 @@ class Telcontrol(tr.Thread):
         Move the telescope on the X axis towards pixel direction(int) in the speed specified(int[0-9])
     moveY(self,direction,speed)
         Move the telescope on the X axis towards pixel direction(int) in the speed specified(int[0-9])
+    getCommandStats(self)
+        The counters of the serial writer thread (requested, unchanged, coalesced, sent)
+    startPolling(self, rate)
+        Start a background poller of the mount position
+    getPose(self)
+        The latest (azimuth, altitude, time) of the mount, without waiting for the serial port
     goToZero(self)
         Move the telescope to [0,0]
     manualLeft(self,speed)
@@ -63,7 +73,7 @@ class Telcontrol(tr.Thread):
     telescopeY_Direction = 0
     telescopeY_Speed = 0
 
-    def __init__(self, port='COM4', baudrate="9600", mindx=10, mindy=10, maxdx=1000, maxdy=1000):
+    def __init__(self, port='COM4', baudrate="9600", mindx=10, mindy=10, maxdx=1000, maxdy=1000, max_rate=20):
         """ Init the Telescope
         Parameters
         ----------
@@ -80,6 +90,8 @@ class Telcontrol(tr.Thread):
             max pixel in x axis
         maxdy : int
             max pixel in y axis
+        max_rate : float
+            the maximal number of slew commands per second on the serial port
         """
 
         tr.Thread.__init__(self)
@@ -99,49 +111,50 @@ class Telcontrol(tr.Thread):
         self.readyLock = tr.Lock()
         self.diffaz = 0
         self.diffelv = 0
+
+        # The slew commands are written by a single writer thread, moveX / moveY only replace the
+        # latest command of their axis, so a command that was superseded before it was sent is dropped.
+        self.commandLock = tr.Condition()
+        self.serialLock = tr.Lock()
+        self.poller = None
+        self.commands = {'X': None, 'Y': None}
+        self.minInterval = 1.0 / max_rate if max_rate else 0.0
+        self.lastSent = 0.0
+        self.lastAxis = 'Y'
+        self.requested = 0
+        self.unchanged = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.writing = True
+        self.writer = tr.Thread(target=self.writeCommands, name='TelescopeWriter', daemon=True)
+        self.writer.start()
         self.start()
 
         self.oldx = 0
         self.oldy = 0
 
     def angle_to_24bit(self, ang):
-        num = int((ang / 360) * two_inTwentyFour)
-        # print(num)
-        high = int(num / 65536)
-        res = num % 65536
-        # print(res)
-        medium = int(res / 256)
-        res = res % 256
-        low = res
-        return [high, medium, low]
+        return list(nexstar.angleTo24bit(ang))
 
     def resetAltTelescope(self):
-        to_send = chr(80) + chr(4) + chr(17) + chr(4) + chr(0) + chr(0) + chr(0) + chr(0)
-        self.ser.write(to_send.encode())
+        self.ser.write(nexstar.setPositionPacket(nexstar.ALT, 0))
 
     def resetAzmTelescope(self, resetang=[0, 0, 0]):
-        to_send = chr(80) + chr(4) + chr(16) + chr(4) + chr(0) + chr(0) + chr(0) + chr(0)
-        self.ser.write(to_send.encode())
+        self.ser.write(nexstar.setPositionPacket(nexstar.AZM, 0))
 
     def setAzimut(self, ang):
         if (ang < 0):
             ang = 360 + ang
         if (ang > 360):
             ang = ang - 360
-        angtosend = self.angle_to_24bit(ang)
-        to_send = chr(80) + chr(4) + chr(16) + chr(23) + chr(angtosend[0]) + chr(angtosend[1]) + chr(
-            angtosend[2]) + chr(0)
-        self.ser.write(to_send.encode())
+        self.ser.write(nexstar.gotoPacket(nexstar.AZM, ang))
 
     def setAltitude(self, ang):
         if (ang < 0):
             ang = 0
         if (ang > 180):
             ang = 0
-        angtosend = self.angle_to_24bit(ang)
-        to_send = chr(80) + chr(4) + chr(17) + chr(23) + chr(angtosend[0]) + chr(angtosend[1]) + chr(
-            angtosend[2]) + chr(0)
-        self.ser.write(to_send.encode())
+        self.ser.write(nexstar.gotoPacket(nexstar.ALT, ang))
 
     def connect(self):
         """ Connects the telescope """
@@ -153,16 +166,16 @@ class Telcontrol(tr.Thread):
             self.ser.close()
 
     def initProtocol(self):
-        self.midLeft = chr(80) + chr(2) + chr(16) + chr(37) + chr(6) + chr(142) + chr(56) + chr(0)  # go left slow speed
-        self.midRight = chr(80) + chr(2) + chr(16) + chr(36) + chr(6) + chr(142) + chr(56) + chr(
-            0)  # going right at speed of 4
-        self.stop_r = chr(80) + chr(2) + chr(16) + chr(36) + chr(0) + chr(0) + chr(0) + chr(0)  # Stop
-        self.stop_l = chr(80) + chr(2) + chr(16) + chr(37) + chr(0) + chr(0) + chr(0) + chr(0)
+        # the packets are bytes (see nexstar_protocol.py), a str with chr(142) was sent as 2 UTF-8 bytes
+        self.midLeft = nexstar.slewPacket(nexstar.AZM, nexstar.NEGATIVE, 6)  # go left at speed of 6
+        self.midRight = nexstar.slewPacket(nexstar.AZM, nexstar.POSITIVE, 6)  # going right at speed of 6
+        self.stop_r = nexstar.slewPacket(nexstar.AZM, nexstar.POSITIVE, 0)  # Stop
+        self.stop_l = nexstar.slewPacket(nexstar.AZM, nexstar.NEGATIVE, 0)
 
-        self.midUp = chr(80) + chr(2) + chr(17) + chr(36) + chr(6) + chr(142) + chr(56) + chr(0)  # up
-        self.midDown = chr(80) + chr(2) + chr(17) + chr(37) + chr(6) + chr(142) + chr(56) + chr(0)  # down
-        self.Stop_d = chr(80) + chr(2) + chr(17) + chr(37) + chr(0) + chr(0) + chr(0) + chr(0)  # stop
-        self.Stop_u = chr(80) + chr(2) + chr(17) + chr(36) + chr(0) + chr(0) + chr(0) + chr(0)
+        self.midUp = nexstar.slewPacket(nexstar.ALT, nexstar.POSITIVE, 6)  # up
+        self.midDown = nexstar.slewPacket(nexstar.ALT, nexstar.NEGATIVE, 6)  # down
+        self.Stop_d = nexstar.slewPacket(nexstar.ALT, nexstar.NEGATIVE, 0)  # stop
+        self.Stop_u = nexstar.slewPacket(nexstar.ALT, nexstar.POSITIVE, 0)
 
         self.StopX = (b':K1\r=\r')
         self.StopY = (b':K2\r=\r')
@@ -203,21 +216,21 @@ class Telcontrol(tr.Thread):
         print("correct_x")
         # print(math.fabs(self.diffaz), "fabs")
         if (rl > self.mindx):
-            self.ser.write(self.midRight.encode())
+            self.ser.write(self.midRight)
             # time.sleep(5)
             # self.ser.write(self.stop_rl.encode())
             # self.ser.write(self.stop_rl.encode())
             print(" move right ", rl)
         if (rl < -self.mindx):
-            self.ser.write(self.midLeft.encode())
+            self.ser.write(self.midLeft)
             # time.sleep(5)
             # self.ser.write(self.stop_rl.encode())
             # self.ser.write(self.stop_rl.encode())
             print(" move left ", rl)
 
         if (math.fabs(rl) > self.maxdx or math.fabs(rl) < self.mindx or isStop == 1):
-            self.ser.write(self.stop_r.encode())
-            self.ser.write(self.stop_l.encode())
+            self.ser.write(self.stop_r)
+            self.ser.write(self.stop_l)
             print("stop x")
 
             # time.sleep(0.1)
@@ -229,30 +242,30 @@ class Telcontrol(tr.Thread):
         # print(math.fabs(self.diffaz), "fabs")
 
         if (ud > self.mindy):
-            self.ser.write(self.midUp.encode())
+            self.ser.write(self.midUp)
             # time.sleep(5)
             # self.ser.write(self.Stop_ud.encode())
             print(" move up ", ud)
         if (ud < - self.mindy):
-            self.ser.write(self.midDown.encode())
+            self.ser.write(self.midDown)
             # time.sleep(5)
 
             # self.ser.write(self.Stop_ud.encode())
             print(" move down  ", ud)
         if (math.fabs(ud) > self.maxdy or math.fabs(ud) < self.mindy or isStop == 1):
-            self.ser.write(self.Stop_d.encode())
-            self.ser.write(self.Stop_u.encode())
+            self.ser.write(self.Stop_d)
+            self.ser.write(self.Stop_u)
             print("stop y")
 
     def stop_x(self):
         """ Stops the telescope's movement on the x axis """
-        self.ser.write(self.stop_r.encode())
-        self.ser.write(self.stop_l.encode())
+        self.ser.write(self.stop_r)
+        self.ser.write(self.stop_l)
 
     def stop_y(self):
         """ Stops the telescope's movement on the y axis """
-        self.ser.write(self.Stop_d.encode())
-        self.ser.write(self.Stop_u.encode())
+        self.ser.write(self.Stop_d)
+        self.ser.write(self.Stop_u)
 
     def run(self):
         while True:
@@ -260,7 +273,104 @@ class Telcontrol(tr.Thread):
             self.correct()
             self.setReady(True)
 
+    def writeCommands(self):
+        """ The writer thread, sends the latest command of every axis, at most max_rate commands per second """
+        while True:
+            with self.commandLock:
+                while self.writing and self.commands['X'] is None and self.commands['Y'] is None:
+                    self.commandLock.wait()
+                # the rate limit is waited before the command is taken, a newer command
+                # that arrives meanwhile replaces the pending one instead of following it
+                wait = self.lastSent + self.minInterval - time.monotonic()
+                while self.writing and wait > 0:
+                    self.commandLock.wait(timeout=wait)
+                    wait = self.lastSent + self.minInterval - time.monotonic()
+                if not self.writing:
+                    return
+                # when both axes are pending, the axis that waited longer goes first
+                if self.commands['X'] is not None and (self.commands['Y'] is None or self.lastAxis == 'Y'):
+                    axis = 'X'
+                else:
+                    axis = 'Y'
+                self.lastAxis = axis
+                direction, speed = self.commands[axis]
+                self.commands[axis] = None
+
+            with self.serialLock:
+                self.sendCommand(axis, direction, speed)
+            self.lastSent = time.monotonic()
+            self.sent += 1
+
+    def sendCommand(self, axis, direction, speed):
+        """ Writes one slew command, a zero speed stops the axis """
+        if axis == 'X':
+            if speed == 0:
+                self.manualRight(0)
+            elif direction > 0:
+                self.manualRight(speed)
+            else:
+                self.manualLeft(speed)
+        else:
+            if speed == 0:
+                self.manualUp(0)
+            elif direction > 0:
+                self.manualDown(speed)
+            else:
+                self.manualUp(speed)
+
+    def queueCommand(self, axis, direction, speed):
+        """ Replaces the pending command of the axis, the writer thread sends it """
+        with self.commandLock:
+            if self.commands[axis] is not None:
+                self.coalesced += 1
+            self.commands[axis] = (direction, speed)
+            self.commandLock.notify()
+
+    def getCommandStats(self):
+        """ The counters of the writer thread
+        Returns
+        -------
+        dict
+            requested - the moveX / moveY calls, unchanged - the calls that didn't change the command,
+            coalesced - the commands that were replaced before they were sent, sent - the serial writes
+        """
+        return {'requested': self.requested, 'unchanged': self.unchanged,
+                'coalesced': self.coalesced, 'sent': self.sent}
+
+    def stopWriter(self):
+        """ Stops the writer thread, the pending commands are not sent """
+        with self.commandLock:
+            self.writing = False
+            self.commandLock.notify_all()
+        self.writer.join()
+
+    def startPolling(self, rate=5.0):
+        """ Starts the background poller of the mount position
+        Parameters
+        ----------
+        rate : float
+            the number of position queries per second
+        """
+        if self.poller is None:
+            self.poller = PositionPoller(self.ser, rate, lock=self.serialLock)
+
+    def getPose(self):
+        """ The cached pose of the mount, it never waits for the serial port
+        Returns
+        -------
+        tuple
+            (azimuth, altitude, time) in degrees and time.monotonic(), or None before the first reply
+            (or without startPolling)
+        """
+        if self.poller is None:
+            return None
+        return self.poller.getPose()
+
     def stopTelescope(self):
+        if self.poller is not None:
+            self.poller.stop()
+            self.poller = None
+        self.stopWriter()
         self.ser.write(self.StopX)
         self.ser.write(self.StopY)
         self.disconnect()
@@ -270,31 +380,24 @@ class Telcontrol(tr.Thread):
 
     def goToZero(self):
         """ Move the telescope the [0,0] """
-        moveToZero = "b00000000,00000000"
-        self.ser.write(moveToZero.encode())
+        self.ser.write(nexstar.gotoAzmAltPacket(0, 0))
         time.sleep(0.1)
 
     def getPosition(self):
-        # moveRight = chr(69)
-        moveRight = chr(122)
-        self.ser.write(moveRight.encode())
+        """ Queries the position and waits for the reply, use startPolling and getPose in the tracking loop """
+        self.ser.write(nexstar.GET_AZM_ALT)
         time.sleep(0.1)
 
         dataIn = self.ser.read_all()
-        dataStr = str(dataIn)
-        print("got from telescope str: " + dataStr)
-
-        dataStr = dataStr.split(",")
+        print("got from telescope: " + str(dataIn))
 
-        angle_horizontal = dataStr[0].replace('#', '').split("'")[1]
-        angle_horizontal = int(angle_horizontal, 16)
-        angle_horizontal = angle_horizontal / 4294967296 * 360
+        position = nexstar.parsePosition(dataIn)
+        if position is None:
+            return None
+        angle_horizontal, angle_vertical = position
         print("horizontal: " + str(angle_horizontal))
-
-        angle_vertical = dataStr[1].split("#")[0]
-        angle_vertical = int(angle_vertical, 16)
-        angle_vertical = angle_vertical / 4294967296 * 360
         print("vertical: " + str(angle_vertical))
+        return position
 
     def manualRight(self, speed=3):
         """ Go right in the speed specified
@@ -303,8 +406,8 @@ class Telcontrol(tr.Thread):
     speed : int
         the speed of the movement of the telescope to the right
         """
-        moveRight = chr(80) + chr(2) + chr(16) + chr(36) + chr(speed) + chr(0) + chr(0) + chr(0)
-        self.ser.write(moveRight.encode())
+        with timed('serial.write'):
+            self.ser.write(nexstar.SLEW[(nexstar.AZM, nexstar.POSITIVE, speed)])
 
     def manualLeft(self, speed=3):
         """ Go left in the speed specified
@@ -313,8 +416,8 @@ class Telcontrol(tr.Thread):
     speed : int
         the speed of the movement of the telescope to the left
         """
-        moveLeft = chr(80) + chr(2) + chr(16) + chr(37) + chr(speed) + chr(0) + chr(0) + chr(0)
-        self.ser.write(moveLeft.encode())
+        with timed('serial.write'):
+            self.ser.write(nexstar.SLEW[(nexstar.AZM, nexstar.NEGATIVE, speed)])
 
     def manualUp(self, speed=3):
         """ Go up in the speed specified
@@ -323,8 +426,8 @@ class Telcontrol(tr.Thread):
     speed : int
         the speed of the movement of the telescope upwards
         """
-        moveUp = chr(80) + chr(2) + chr(17) + chr(36) + chr(speed) + chr(0) + chr(0) + chr(0)
-        self.ser.write(moveUp.encode())
+        with timed('serial.write'):
+            self.ser.write(nexstar.SLEW[(nexstar.ALT, nexstar.POSITIVE, speed)])
 
     def manualDown(self, speed=3):
         """ Go down in the speed specified
@@ -333,21 +436,21 @@ class Telcontrol(tr.Thread):
     speed : int
         the speed of the movement of the telescope downwards
         """
-        moveDown = chr(80) + chr(2) + chr(17) + chr(37) + chr(speed) + chr(0) + chr(0) + chr(0)
-        self.ser.write(moveDown.encode())
+        with timed('serial.write'):
+            self.ser.write(nexstar.SLEW[(nexstar.ALT, nexstar.NEGATIVE, speed)])
 
     def stopX(self):
         """ Stops the movement of the telescope on the X axis """
         print("stop x")
-        stopMoveX = chr(80) + chr(2) + chr(16) + chr(36) + chr(0) + chr(0) + chr(0) + chr(0)
-        self.ser.write(stopMoveX.encode())
+        with timed('serial.write'):
+            self.ser.write(nexstar.stopPacket(nexstar.AZM))
         time.sleep(0.1)
 
     def stopY(self):
         """ Stops the movement of the telescope on the Y axis """
         print("stop y")
-        stopMoveY = chr(80) + chr(2) + chr(17) + chr(36) + chr(0) + chr(0) + chr(0) + chr(0)
-        self.ser.write(stopMoveY.encode())
+        with timed('serial.write'):
+            self.ser.write(nexstar.stopPacket(nexstar.ALT))
         time.sleep(0.1)
 
     def stop(self):
@@ -365,20 +468,22 @@ class Telcontrol(tr.Thread):
             the speed of the telescope's movement on the x axis in int
             """
 
+        self.requested += 1
         if abs(direction) < 2:
             if (self.telescopeX_Speed != 0):
-                self.stopX()
                 self.telescopeX_Speed = 0
+                self.queueCommand('X', direction, 0)
+            else:
+                self.unchanged += 1
         else:
-            if (self.telescopeX_Direction != direction | self.telescopeX_Speed != speed):
+            # only the sign of the direction and the speed change the slew command
+            if ((self.telescopeX_Direction > 0) != (direction > 0)) or (self.telescopeX_Speed != speed):
 
                 self.telescopeX_Direction = direction
                 self.telescopeX_Speed = speed
-
-                if (direction > 0):
-                    self.manualRight(speed)
-                else:
-                    self.manualLeft(speed)
+                self.queueCommand('X', direction, speed)
+            else:
+                self.unchanged += 1
 
     def moveY(self, direction, speed):
         """ Moves the telescope on the Y axis
@@ -390,20 +495,20 @@ class Telcontrol(tr.Thread):
             the speed of the telescope's movement on the Y axis in int
             """
 
+        self.requested += 1
         if abs(direction) < 2:
 
             if (self.telescopeY_Speed != 0):
-                self.stopY()
                 self.telescopeY_Speed = 0
+                self.queueCommand('Y', direction, 0)
+            else:
+                self.unchanged += 1
         else:
-
-            if (self.telescopeY_Direction != direction | self.telescopeY_Speed != speed):
+            # only the sign of the direction and the speed change the slew command
+            if ((self.telescopeY_Direction > 0) != (direction > 0)) or (self.telescopeY_Speed != speed):
 
                 self.telescopeY_Direction = direction
                 self.telescopeY_Speed = speed
-
-                if (direction > 0):
-                    self.manualDown(speed)
-
-                else:
-                    self.manualUp(speed)
+                self.queueCommand('Y', direction, speed)
+            else:
+                self.unchanged += 1
@@ -0,0 +1,141 @@
+"""
+    The serial protocol of the NexStar 8SE hand control, as raw bytes.
+    Building the packets with chr() and str.encode() turns every byte >= 0x80 into two UTF-8 bytes
+    and corrupts the packet, here every packet is a bytes object, and the slew packets of every
+    axis, direction and speed are built once, so a slew update is a single write of a ready packet.
+
+    The motor commands are pass-through packets to the motor controllers:
+        'P', length, destination, message id, data 1, data 2, data 3, response length
+    The length counts the message id and the used data bytes, the unused data bytes are zero.
+"""
+
+PASS_THROUGH = 0x50          # 'P'
+
+# the destinations of a pass-through packet
+AZM = 0x10
+ALT = 0x11
+AXES = (AZM, ALT)
+
+# the message ids of the motor controllers
+MC_SET_POSITION = 0x04
+MC_GOTO_FAST = 0x02
+MC_GOTO_SLOW = 0x17
+MC_MOVE_POS = 0x24
+MC_MOVE_NEG = 0x25
+
+POSITIVE = 1
+NEGATIVE = -1
+SPEEDS = range(10)
+
+GET_AZM_ALT = b'z'           # the precise AZM-ALT position query, the reply is 'XXXXXXXX,YYYYYYYY#'
+GET_AZM_ALT_REPLY = 18
+
+TWO_IN_24 = 1 << 24
+TWO_IN_32 = 1 << 32
+
+
+"""
+    :param axis - AZM or ALT.
+    :param message - the message id.
+    :param data - up to 3 data bytes.
+    :param response - the number of bytes the controller replies (without the '#').
+    :return the 8 bytes of the packet.
+"""
+
+
+def passThrough(axis, message, data=(), response=0) -> bytes:
+    if len(data) > 3:
+        raise ValueError('A pass-through packet has at most 3 data bytes')
+    payload = list(data) + [0] * (3 - len(data))
+    return bytes([PASS_THROUGH, len(data) + 1, axis, message] + payload + [response])
+
+
+def buildSlewTable() -> dict:
+    table = {}
+    for axis in AXES:
+        for direction, message in ((POSITIVE, MC_MOVE_POS), (NEGATIVE, MC_MOVE_NEG)):
+            for speed in SPEEDS:
+                table[(axis, direction, speed)] = passThrough(axis, message, (speed,))
+    return table
+
+
+# (axis, direction, speed) -> the fixed-rate slew packet, speed 0 stops the axis
+SLEW = buildSlewTable()
+
+
+"""
+    :param axis - AZM or ALT.
+    :param direction - the sign gives the direction, positive is right (AZM) or up (ALT).
+    :param speed - the fixed rate, 0-9, 0 stops the axis.
+    :return the pre-built slew packet.
+"""
+
+
+def slewPacket(axis, direction, speed) -> bytes:
+    return SLEW[(axis, POSITIVE if direction > 0 else NEGATIVE, speed)]
+
+
+def stopPacket(axis) -> bytes:
+    return SLEW[(axis, POSITIVE, 0)]
+
+
+"""
+    :param angle - the angle in degrees, it wraps around 360.
+    :return the 3 bytes (high, medium, low) of the angle as a 24-bit fraction of a revolution.
+"""
+
+
+def angleTo24bit(angle) -> bytes:
+    value = int((angle % 360) / 360 * TWO_IN_24) % TWO_IN_24
+    return value.to_bytes(3, 'big')
+
+
+"""
+    :param axis - AZM or ALT.
+    :param angle - the target angle in degrees.
+    :param slow - True for the slow (precise) GOTO, else the fast GOTO.
+    :return the GOTO packet of one axis.
+"""
+
+
+def gotoPacket(axis, angle, slow=True) -> bytes:
+    return passThrough(axis, MC_GOTO_SLOW if slow else MC_GOTO_FAST, angleTo24bit(angle))
+
+
+"""
+    :return the packet that sets the current position of the axis to 'angle' (degrees).
+"""
+
+
+def setPositionPacket(axis, angle=0.0) -> bytes:
+    return passThrough(axis, MC_SET_POSITION, angleTo24bit(angle))
+
+
+"""
+    :return the precise AZM-ALT GOTO command ('b'), both angles are 32-bit fractions of a revolution.
+"""
+
+
+def gotoAzmAltPacket(azm, alt) -> bytes:
+    return b'b%08X,%08X' % (int((azm % 360) / 360 * TWO_IN_32), int((alt % 360) / 360 * TWO_IN_32))
+
+
+"""
+    Parses the reply of the position query 'z' (or 'Z', the 16-bit version).
+
+    :param reply - the bytes of the reply, for example b'12AB0500,40000500#'.
+    :return (azimuth, altitude) in degrees, or None if the reply is not a position.
+"""
+
+
+def parsePosition(reply):
+    reply = bytes(reply).strip().rstrip(b'#')
+    parts = reply.split(b',')
+    if len(parts) != 2 or len(parts[0]) != len(parts[1]) or len(parts[0]) not in (4, 8):
+        return None
+    try:
+        azm, alt = int(parts[0], 16), int(parts[1], 16)
+    except ValueError:
+        return None
+    full = 1 << (4 * len(parts[0]))
+    return azm / full * 360, alt / full * 360
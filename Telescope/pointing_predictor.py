@@ -0,0 +1,107 @@
+import time
+from collections import deque
+
+"""
+    This class compensates the delay between the camera and the mount.
+    A command built from the position in the current frame reaches the mount only after the decode,
+    the detection, the GUI and the serial delays, so a fast target (an ISS pass moves several
+    frame-widths per second) always trails the crosshair.
+
+    The velocity of the target is a least-squares line over its last positions and their capture
+    times (FrameReader.capture_time of a live camera, the position of the frame in a video file, whose
+    decode time includes the wait in the queue), and the end-to-end delay is measured on every frame,
+    from the capture of the frame to the command. The telescope is steered toward the point where the target
+    will be when the mount reacts:
+
+        predicted = position + velocity * (loop delay + mount delay)
+"""
+
+
+class PointingPredictor:
+    """
+        :param history - the number of positions of the velocity fit.
+        :param mount_delay - the time (seconds) from a serial command to the reaction of the mount.
+        :param max_lead - the longest prediction (seconds), a bad fit can't throw the telescope away.
+        :param max_gap - a gap longer than this (seconds) between two positions starts a new history.
+    """
+
+    def __init__(self, history=6, mount_delay=0.15, max_lead=0.5, max_gap=0.5):
+        self.positions = deque(maxlen=history)
+        self.mount_delay = mount_delay
+        self.max_lead = max_lead
+        self.max_gap = max_gap
+        self.velocity = (0.0, 0.0)
+        self.delay = 0.0
+        self.avg_delay = 0.0
+        self.lead = 0.0
+
+    """
+        Adds the position of a frame to the history, a lost target clears it.
+
+        :param position - the (X,Y) position of the target, or (-1, -1).
+        :param capture_time - the time.monotonic() the frame was captured.
+    """
+
+    def observe(self, position, capture_time):
+        if position[0] == -1 or position[1] == -1:
+            self.positions.clear()
+            self.velocity = (0.0, 0.0)
+            return
+        if self.positions and not 0 < capture_time - self.positions[-1][0] <= self.max_gap:
+            self.positions.clear()
+        self.positions.append((capture_time, position[0], position[1]))
+        self.velocity = self.fitVelocity()
+
+    """
+        :return the (VX, VY) velocity (pixels per second), the slope of the least-squares line.
+    """
+
+    def fitVelocity(self) -> tuple:
+        count = len(self.positions)
+        if count < 2:
+            return 0.0, 0.0
+
+        mean_t = sum(p[0] for p in self.positions) / count
+        mean_x = sum(p[1] for p in self.positions) / count
+        mean_y = sum(p[2] for p in self.positions) / count
+        stt = sum((p[0] - mean_t) ** 2 for p in self.positions)
+        if stt <= 0:
+            return 0.0, 0.0
+        vx = sum((p[0] - mean_t) * (p[1] - mean_x) for p in self.positions) / stt
+        vy = sum((p[0] - mean_t) * (p[2] - mean_y) for p in self.positions) / stt
+        return vx, vy
+
+    """
+        :param position - the (X,Y) position of the target in this frame, or (-1, -1).
+        :param capture_time - the time.monotonic() the frame was captured.
+        :param shape - the (height, width) of the frame, the prediction is kept inside it.
+        :param now - the time.monotonic() of the command, by default the current time,
+                  for a video file the frame time itself (no loop delay).
+        :return the predicted (X,Y) position, or (-1, -1) if the target is lost.
+    """
+
+    def predict(self, position, capture_time, shape=None, now=None) -> tuple:
+        self.observe(position, capture_time)
+        if position[0] == -1 or position[1] == -1:
+            self.lead = 0.0
+            return position
+
+        now = time.monotonic() if now is None else now
+        self.delay = max(now - capture_time, 0.0)
+        self.avg_delay = self.delay if self.avg_delay == 0.0 else 0.9 * self.avg_delay + 0.1 * self.delay
+        self.lead = min(self.delay + self.mount_delay, self.max_lead)
+
+        x = position[0] + self.velocity[0] * self.lead
+        y = position[1] + self.velocity[1] * self.lead
+        if shape is not None:
+            x = min(max(x, 0), shape[1] - 1)
+            y = min(max(y, 0), shape[0] - 1)
+        return int(x), int(y)
+
+    """
+        :return the velocity (pixels per second) and the measured delays (milliseconds).
+    """
+
+    def getStats(self) -> dict:
+        return {'velocity': self.velocity, 'delay_ms': self.delay * 1000,
+                'avg_delay_ms': self.avg_delay * 1000, 'lead_ms': self.lead * 1000}
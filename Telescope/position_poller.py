@@ -0,0 +1,106 @@
+import threading
+import time
+
+from Telescope import nexstar_protocol as nexstar
+
+"""
+    A background poller of the mount position.
+    It sends the 'z' query at a fixed rate and reads the serial stream as it comes, without sleeping
+    on a reply, so the pose of the mount costs nothing to the vision loop: the latest azimuth and
+    altitude, with the time they were received, are kept in a cached pose behind a lock.
+
+    The same serial stream carries the '#' acknowledges of the slew commands, the parser keeps
+    the bytes between two '#' and ignores everything that is not a position.
+"""
+
+
+class PositionParser:
+    """
+        An incremental parser of the serial stream, the replies can arrive in any number of pieces.
+    """
+
+    def __init__(self, limit=64):
+        self.buffer = bytearray()
+        self.limit = limit
+
+    """
+        :param data - the new bytes of the stream.
+        :return the list of the (azimuth, altitude) positions completed by these bytes.
+    """
+
+    def feed(self, data) -> list:
+        self.buffer += data
+        positions = []
+        end = self.buffer.find(b'#')
+        while end != -1:
+            position = nexstar.parsePosition(self.buffer[:end])
+            if position is not None:
+                positions.append(position)
+            del self.buffer[:end + 1]
+            end = self.buffer.find(b'#')
+
+        # noise without any '#' can't grow forever
+        if len(self.buffer) > self.limit:
+            del self.buffer[:-nexstar.GET_AZM_ALT_REPLY]
+        return positions
+
+
+class PositionPoller:
+    """
+        :param ser - the open serial port of the telescope.
+        :param rate - the number of position queries per second.
+        :param lock - the lock of the serial writes, shared with the other writers of the port.
+        :param idle - the wait (seconds) when no bytes are waiting on the port.
+    """
+
+    def __init__(self, ser, rate=5.0, lock=None, idle=0.005):
+        self.ser = ser
+        self.period = 1.0 / rate
+        self.lock = lock if lock is not None else threading.Lock()
+        self.idle = idle
+        self.parser = PositionParser()
+        self.poseLock = threading.Lock()
+        self.pose = None
+        self.queries = 0
+        self.replies = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='PositionPoller', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        next_query = time.monotonic()
+        while not self.stopped.is_set():
+            now = time.monotonic()
+            if now >= next_query:
+                with self.lock:
+                    self.ser.write(nexstar.GET_AZM_ALT)
+                self.queries += 1
+                next_query = max(next_query + self.period, now)
+
+            waiting = self.ser.in_waiting
+            if not waiting:
+                self.stopped.wait(min(self.idle, max(next_query - time.monotonic(), 0)))
+                continue
+
+            positions = self.parser.feed(self.ser.read(waiting))
+            if positions:
+                received = time.monotonic()
+                with self.poseLock:
+                    self.pose = positions[-1] + (received,)
+                self.replies += len(positions)
+
+    """
+        :return (azimuth, altitude, time) of the latest position, the angles in degrees and the time
+                in time.monotonic(), or None if no position was received yet.
+    """
+
+    def getPose(self):
+        with self.poseLock:
+            return self.pose
+
+    def getStats(self) -> dict:
+        return {'queries': self.queries, 'replies': self.replies}
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,152 @@
+import argparse
+import array
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from Algorithm.buffer_pool import BufferPool
+from Algorithm.object_tracking import ObjectTracking
+from Algorithm.tracker_backends import BACKENDS
+from Stream.frame_reader import FrameReader, LOSSLESS
+
+"""
+    Offline batch processing of recorded videos.
+    Every video of the given directory is processed by its own headless ObjectTracking
+    in a pool of worker processes, and the per-frame results are saved as a compressed
+    columnar file (.npz, one array per column) next to each other in the output directory,
+    named by the video file with its extension (a.mp4 -> a.mp4.npz):
+
+        frame      - the frame index.
+        timestamp  - the position of the frame in the video, in milliseconds.
+        mode       - 0 = night, 1 = sky, 2 = ground.
+        x, y       - the position of the tracked object, -1 if it isn't tracked.
+        x1, y1, x2, y2 - the box of the tracked object, -1 if it isn't tracked.
+
+    For example:
+        python batch.py Videos results --workers 8 --auto-track 15
+"""
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v')
+MODES = {'night': 0, 'sky': 1, 'ground': 2}
+
+# 32 = 'Space' on the keyboard
+TRACK_KEY = 32
+NO_KEY = -1
+
+
+"""
+    The worker, processes one video and saves its results.
+
+    :param path - the video file.
+    :param output_dir - the directory of the results.
+    :param scale - the working frame scale, the same as SpaceTracker.rescaleFrame().
+    :param detection_scale - the scale of the detection stages (see Algorithm/detection_scale.py).
+    :param auto_track - if not 0, the 'space' key is sent every 'auto_track' frames while nothing is tracked
+                  and the last frame offered a detection (without one the tracker would start on nothing).
+    :param tracker - the tracker backend (see Algorithm/tracker_backends.py).
+    :param detect_interval - while tracking, the detection runs every 'detect_interval' frames
+                  (see Algorithm/scheduler.py).
+    :return a summary dictionary of the video.
+"""
+
+
+def processVideo(path, output_dir, scale=0.5, detection_scale=1.0, auto_track=0, tracker='CSRT',
+                 detect_interval=1):
+    # one OpenCV thread per worker, the pool already uses all the cores
+    cv2.setNumThreads(1)
+
+    capture = FrameReader(path, policy=LOSSLESS)
+    object_tracking = ObjectTracking(detection_scale=detection_scale, tracker=tracker,
+                                     detect_interval=detect_interval, hud=False)
+    columns = {name: array.array('i') for name in ('frame', 'mode', 'x', 'y', 'x1', 'y1', 'x2', 'y2')}
+    timestamps = array.array('d')
+    buffers = BufferPool()
+
+    start = time.perf_counter()
+    frame_index = 0
+    tracked = 0
+    position = (-1, -1)
+    while True:
+        isTrue, frame = capture.read()
+        if not isTrue:
+            break
+        if scale != 1.0:
+            width, height = int(frame.shape[1] * scale), int(frame.shape[0] * scale)
+            frame = cv2.resize(frame, (width, height), dst=buffers.get('working', (height, width) + frame.shape[2:]),
+                               interpolation=cv2.INTER_AREA)
+
+        key = NO_KEY
+        if auto_track and position[0] == -1 and frame_index % auto_track == 0 and object_tracking.hasDetection():
+            key = TRACK_KEY
+
+        position = object_tracking.track(frame, state=key)
+        box = object_tracking.getBox() if position[0] != -1 else (-1, -1, -1, -1)
+        if position[0] != -1:
+            tracked += 1
+
+        columns['frame'].append(frame_index)
+        columns['mode'].append(MODES.get(object_tracking.getMode(), -1))
+        columns['x'].append(int(position[0]))
+        columns['y'].append(int(position[1]))
+        for name, value in zip(('x1', 'y1', 'x2', 'y2'), box):
+            columns[name].append(int(value))
+        timestamps.append(capture.timestamp)
+        frame_index += 1
+
+    capture.release()
+    elapsed = time.perf_counter() - start
+
+    # the extension stays in the name, 'a.mp4' and 'a.avi' of one directory don't overwrite each other
+    output = os.path.join(output_dir, os.path.basename(path) + '.npz')
+    np.savez_compressed(output, timestamp=np.frombuffer(timestamps, np.float64),
+                        **{key: np.frombuffer(value, np.int32) for key, value in columns.items()})
+
+    return {'video': path, 'output': output, 'frames': frame_index, 'tracked': tracked,
+            'fps': frame_index / elapsed if elapsed > 0 else 0.0}
+
+
+def findVideos(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(VIDEO_EXTENSIONS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Process a directory of recordings with SpaceTracker.')
+    parser.add_argument('videos', help='the directory of the recorded videos')
+    parser.add_argument('output', help='the directory of the results (.npz per video)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='the number of worker processes')
+    parser.add_argument('--scale', type=float, default=0.5, help='the working frame scale')
+    parser.add_argument('--detection-scale', type=float, default=1.0, help='the scale of the detection stages')
+    parser.add_argument('--auto-track', type=int, default=0,
+                        help="send 'space' every N frames while nothing is tracked and a detection is offered "
+                             "(0 = never)")
+    parser.add_argument('--tracker', default='CSRT', choices=BACKENDS, help='the tracker backend')
+    parser.add_argument('--detect-interval', type=int, default=1,
+                        help='while tracking, run the detection every N frames')
+    args = parser.parse_args()
+
+    videos = findVideos(args.videos)
+    if not videos:
+        print(f'No videos found in {args.videos}')
+        return
+    os.makedirs(args.output, exist_ok=True)
+
+    print(f'Processing {len(videos)} videos with {args.workers} workers')
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(processVideo, path, args.output, args.scale, args.detection_scale,
+                               args.auto_track, args.tracker, args.detect_interval): path for path in videos}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as error:
+                print(f'{futures[future]}: failed, {error}')
+                continue
+            print(f"{summary['video']}: {summary['frames']} frames, {summary['tracked']} tracked, "
+                  f"{summary['fps']:.1f} fps -> {summary['output']}")
+
+
+if __name__ == '__main__':
+    main()
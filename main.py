@@ -1,20 +1,51 @@
 import cv2
 from serial import SerialException
 from Algorithm.object_tracking import ObjectTracking
+from Algorithm.buffer_pool import BufferPool
+from Algorithm.hud import Hud
+from Stream.frame_reader import FrameReader
+from Stream.process_pipeline import ProcessPipeline
+from Stream.video_recorder import VideoRecorder
+from Stream.event_recorder import EventRecorder
+from Stream.control_source import KeyboardSource, ScriptedKeySource
+from Profiling.stage_timer import timed
 import time
 from Telescope import Telecontrol
+from Telescope.pointing_predictor import PointingPredictor
 from datetime import datetime
 
+# the recording frame rate of a source that doesn't report one (some cameras)
+FALLBACK_FPS = 30.0
+
 
 class SpaceTracker:
 
-    def __init__(self, telescopeEnabled=True, port=None):
+    """
+        :param telescopeEnabled - True if the telescope is connected.
+        :param port - the serial port of the telescope.
+        :param headless - if True, no window is opened and the loop is not paced by cv2.waitKey,
+                  the commands come from the control source given to start().
+        :param mount_delay - the reaction time (seconds) of the mount to a serial command,
+                  the telescope is steered to where the target will be after the loop and mount delays
+                  (see Telescope/pointing_predictor.py). None steers to the current position.
+        :param poll_rate - the number of mount position queries per second, the pose is read
+                  from a cache on every frame (see Telescope/position_poller.py). 0 turns it off.
+    """
+
+    def __init__(self, telescopeEnabled=True, port=None, headless=False, mount_delay=0.15, poll_rate=5.0):
         self.telescopeEnabled = telescopeEnabled
+        self.headless = headless
         self.capture = None
         self.frame = None
         self.out = None
         self.object_tracking = None
+        self.hud = None
         self.key = None
+        self.pose = None
+        # a live camera (a camera index), the frames of a file are not captured in real time
+        self.live = True
+        self.buffers = BufferPool()
+        self.predictor = PointingPredictor(mount_delay=mount_delay) if mount_delay is not None else None
 
         if self.telescopeEnabled:
             if port is None:
@@ -23,43 +54,145 @@ class SpaceTracker:
             try:
                 self.telescope = Telecontrol.Telcontrol(port)
                 time.sleep(2)
+                if poll_rate:
+                    self.telescope.startPolling(poll_rate)
             except SerialException as error:
                 print('Telescope is not connected!')
                 print(f'Error details: {error}')
                 exit()
 
-    def start(self, video_path):
-        self.capture = cv2.VideoCapture(video_path)
-        self.capture.set(cv2.CAP_ANY, 0)
-        isTrue, self.frame = self.capture.read()
-        self.rescaleFrame(scale=0.5)
-        height, width, channels = self.frame.shape
-        self.out = cv2.VideoWriter('video.avi', cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'), 10,
-                                   (int(width), int(height)))
-        self.object_tracking = ObjectTracking()
+    """
+        :param video_path - a camera index or a path to a video file.
+        :param policy - the FrameReader policy, 'drop' (drop-oldest) for live cameras
+                  or 'block' (lossless) for offline files. If it's empty, it is chosen by the source.
+        :param buffer_size - the number of frames the capture stage can prefetch.
+        :param recording_policy - what the recording stage does when it can't keep up,
+                  'block', 'drop' or 'degrade' (see VideoRecorder).
+        :param control - the source of the commands (see Stream/control_source.py).
+                  If it's empty, the keyboard is used, or no commands at all in headless mode.
+        :param detection_scale - the scale of the detection stages relative to the working frame,
+                  for example 0.25 runs MOG2 on 1/16 of the pixels.
+        :param record - if True, the frames and their graphics are recorded to 'video.avi',
+                  at the frame rate of the source. A headless run without recording doesn't draw the graphics at all.
+        :param events - if True, only the events are recorded: segments of the time a target is detected
+                  or tracked, with the seconds before it ('pre_roll'), into the 'recordings' directory
+                  (see Stream/event_recorder.py).
+        :param pre_roll - the seconds recorded before an event.
+        :param segment_seconds - the longest segment file of an event.
+        :param processes - if True, the capture and the tracking run in their own processes and
+                  the frames are shared through shared memory (see Stream/process_pipeline.py),
+                  this process steers the telescope, records and displays.
+        :param slots - the number of frames in flight between the processes.
+    """
 
-        while self.capture.isOpened():
-            key = cv2.waitKey(30)
+    def start(self, video_path, policy=None, buffer_size=4, recording_policy='drop', control=None,
+              detection_scale=1.0, record=True, processes=False, slots=8, events=False, pre_roll=3.0,
+              segment_seconds=300.0):
+        if control is None:
+            control = ScriptedKeySource() if self.headless else KeyboardSource()
+        self.live = isinstance(video_path, int)
+
+        # the graphics are composited only for the window and the recording
+        render = record or not self.headless
+        if processes:
+            self.capture = ProcessPipeline(video_path, scale=0.5, slots=slots, policy=policy, capacity=buffer_size,
+                                           tracking_args={'detection_scale': detection_scale, 'hud': render})
+            height, width = self.capture.getShape()[:2]
+            # the tracking process draws its own graphics, the telescope ones are drawn here
+            self.hud = Hud(enabled=render)
+        else:
+            self.capture = FrameReader(video_path, capacity=buffer_size, policy=policy)
             isTrue, self.frame = self.capture.read()
             self.rescaleFrame(scale=0.5)
+            height, width, channels = self.frame.shape
+            self.object_tracking = ObjectTracking(detection_scale=detection_scale, hud=render)
+            self.hud = self.object_tracking.getHud()
+        if record:
+            fourcc = cv2.VideoWriter_fourcc('M', 'J', 'P', 'G')
+            fps = self.capture.getFps() or FALLBACK_FPS
+            if events:
+                self.out = EventRecorder('recordings', fourcc, fps, (int(width), int(height)), pre_roll=pre_roll,
+                                         segment_seconds=segment_seconds, policy=recording_policy)
+            else:
+                self.out = VideoRecorder('video.avi', fourcc, fps, (int(width), int(height)),
+                                         policy=recording_policy)
 
-            position = self.object_tracking.track(self.frame, state=key)
-            self.frame = self.object_tracking.getFrame()
-            self.moveTelescope(position)
-            self.out.write(self.frame)
+        frame_index = 0
+        while self.capture.isOpened():
+            key = control.poll(frame_index)
+            frame_index += 1
+            if processes:
+                self.capture.send(key)
+                self.hud.clear()
+            isTrue, self.frame = self.capture.read()
+            if not isTrue:
+                break
+
+            if processes:
+                position = self.capture.result['position']
+                target = self.capture.result['target']
+            else:
+                with timed('rescaleFrame'):
+                    self.rescaleFrame(scale=0.5)
+                with timed('track'):
+                    position = self.object_tracking.track(self.frame, state=key)
+                target = self.object_tracking.hasTarget()
+            with timed('moveTelescope'):
+                self.moveTelescope(position, key)
+            if self.telescopeEnabled:
+                self.showPose()
+
+            if render:
+                if processes:
+                    display = self.hud.render(self.frame, dst=self.frame)
+                else:
+                    display = self.object_tracking.render()
+                if self.out:
+                    with timed('recorder.queue'):
+                        if events:
+                            self.out.write(display, target)
+                        else:
+                            self.out.write(display)
 
-            cv2.imshow("Space Tracker", self.frame)
+                if not self.headless:
+                    with timed('imshow'):
+                        cv2.imshow("Space Tracker", display)
 
             # 27 = 'Esc' on the keyboard
             if key == 27 or key & 0xFF == ord('q'):
                 print(f'Exit program at {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}')
                 break
 
+        print(f'Capture buffer: {self.capture.dropped} dropped of {self.capture.decoded} decoded frames')
+        # the recording is finished first, it doesn't depend on the capture
+        if self.out:
+            self.out.release()
+            print(f'Recording: {self.out.getStats()}')
+        # the frames are views of the capture buffers (the shared memory of the processes),
+        # they are dropped before it is closed
+        display = None
+        self.frame = None
         self.capture.release()
-        self.out.release()
-        cv2.destroyAllWindows()
+        if self.telescopeEnabled:
+            print(f'Telescope commands: {self.telescope.getCommandStats()}')
+        control.close()
+        if not self.headless:
+            cv2.destroyAllWindows()
+
+    """
+        :param position - the (X,Y) position of the tracked object, moved ahead by the predictor.
+        :param key - the key of this frame, 'c' stops the telescope.
+    """
+
+    def moveTelescope(self, position, key=-1):
+        if self.predictor:
+            frame_time = self.frameTime()
+            # a file is not played in real time, there is no loop delay to lead, only the mount delay
+            now = None if self.live else frame_time
+            position = self.predictor.predict(position, frame_time, self.frame.shape[:2], now=now)
+            if position[0] != -1:
+                self.hud.circle(position, 3, (0, 255, 255), -1)
 
-    def moveTelescope(self, position):
         if self.telescopeEnabled and position[0] != -1 and position[1] != -1:
             dx = position[0] - (self.frame.shape[1] // 2)
             dy = position[1] - (self.frame.shape[0] // 2)
@@ -76,15 +209,14 @@ class SpaceTracker:
                 sx = 3
 
             if abs(dy) < 100:
-                sx = 6
+                sy = 6
             if abs(dy) < 75:
-                sx = 4
+                sy = 4
             if abs(dy) < 50:
-                sx = 3
+                sy = 3
             if abs(dy) < 10:
-                sx = 3
+                sy = 3
 
-            key = cv2.waitKey(30)
             if key == 67 or key == 99:
                 sx = 0
                 sy = 0
@@ -94,11 +226,33 @@ class SpaceTracker:
 
 
 
+    """
+        :return the time (seconds) of the frame for the predictor, the capture time of a live camera,
+                or the position of the frame in a file (its decode time includes the wait in the queue).
+    """
+
+    def frameTime(self):
+        if self.live:
+            return self.capture.capture_time
+        return self.capture.timestamp / 1000.0
+
+    """
+        Reads the cached pose of the mount and displays it at the bottom of the frame (in the HUD).
+    """
+
+    def showPose(self):
+        self.pose = self.telescope.getPose()
+        if self.pose is not None:
+            self.hud.putText(f'AZ {self.pose[0]:7.3f} ALT {self.pose[1]:7.3f}',
+                             (5, self.frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0))
+
     def rescaleFrame(self, scale=1.0):
         w = int(self.frame.shape[1] * scale)
         h = int(self.frame.shape[0] * scale)
         dimensions = (w, h)
-        self.frame = cv2.resize(self.frame, dimensions, interpolation=cv2.INTER_AREA)
+        # the working frame is written over the last one, the recorder keeps its own copies
+        working = self.buffers.get('working', (h, w) + self.frame.shape[2:])
+        self.frame = cv2.resize(self.frame, dimensions, dst=working, interpolation=cv2.INTER_AREA)
 
 
 if __name__ == '__main__':
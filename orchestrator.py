@@ -0,0 +1,254 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from Algorithm.object_tracking import ObjectTracking
+from Stream.control_source import ScriptedKeySource
+from Stream.frame_reader import FrameReader, DROP_OLDEST
+from main import SpaceTracker
+
+"""
+    Several capture -> tracker -> mount chains in one process, for example a wide-field finder camera
+    next to the scope camera, or two mounts.
+
+    Every chain is a headless SpaceTracker that runs one frame at a time (step()), the Orchestrator
+    runs the steps of all the chains on one shared pool of worker threads (OpenCV releases the GIL
+    while it works), and never two steps of the same chain at once:
+        - fps      - a chain is stepped at most 'fps' times per second, None runs it as fast as it can.
+        - priority - when more chains are due than there are free workers, the higher priority goes first,
+                     a starved chain reads the newest frame of its FrameReader when its turn comes.
+    The OpenCV threads are divided between the workers, so the workers don't fight over the cores.
+
+    A Handoff passes a target from one chain to another: when the wide-field chain tracks a target inside
+    the part of its frame the narrow-field camera sees, the narrow-field tracker is seeded with the
+    target box (see ObjectTracking.seed) instead of waiting for its own detection and a key press.
+
+    For example:
+        wide = Chain('wide', 0, fps=15, priority=0)
+        scope = Chain('scope', 1, port='COM4', fps=30, priority=1)
+        Orchestrator([wide, scope], [Handoff(wide, scope, region=(280, 150, 680, 390))]).run()
+"""
+
+
+class Chain(SpaceTracker):
+    """
+        :param name - the name of the chain, for the logs and the statistics.
+        :param video_path - a camera index or a path to a video file.
+        :param port - the serial port of the mount of this chain, None if it has no mount.
+        :param fps - the frame rate target of the chain, None for as fast as possible.
+        :param priority - the chains of higher priority are stepped first.
+        :param policy - the FrameReader policy, DROP_OLDEST by default, a late chain skips to the newest frame.
+        :param scale - the working frame scale.
+        :param control - the source of the commands of this chain, no commands if it's empty.
+        :param tracking_args - more arguments of the ObjectTracking of the chain.
+        :param mount_delay, poll_rate - see SpaceTracker.
+    """
+
+    def __init__(self, name, video_path, port=None, fps=None, priority=0, policy=DROP_OLDEST, buffer_size=4,
+                 scale=0.5, detection_scale=1.0, control=None, tracking_args=None, mount_delay=0.15, poll_rate=5.0):
+        super().__init__(telescopeEnabled=port is not None, port=port, headless=True, mount_delay=mount_delay,
+                         poll_rate=poll_rate)
+        self.name = name
+        self.period = 1.0 / fps if fps else 0.0
+        self.priority = priority
+        self.scale = scale
+        self.control = control if control is not None else ScriptedKeySource()
+        self.capture = FrameReader(video_path, capacity=buffer_size, policy=policy)
+        self.live = isinstance(video_path, int)
+        self.object_tracking = ObjectTracking(detection_scale=detection_scale, hud=False, **(tracking_args or {}))
+        self.hud = self.object_tracking.getHud()
+        self.position = (-1, -1)
+        self.frame_index = 0
+        self.finished = False
+        self.busy = False
+        self.due = 0.0
+        self.late = 0
+        self.elapsed = 0.0
+
+    """
+        Reads, tracks and steers one frame.
+    """
+
+    def step(self):
+        start = time.perf_counter()
+        key = self.control.poll(self.frame_index)
+        self.frame_index += 1
+        isTrue, frame = self.capture.read()
+        # 'q' on the keyboard ends the chain
+        if not isTrue or key & 0xFF == ord('q'):
+            self.finished = True
+            return
+
+        self.frame = frame
+        self.rescaleFrame(scale=self.scale)
+        self.position = self.object_tracking.track(self.frame, state=key)
+        self.moveTelescope(self.position, key)
+        if self.telescopeEnabled:
+            self.showPose()
+        self.elapsed += time.perf_counter() - start
+
+    """
+        :return the frame rate the chain got, and how often it started late.
+    """
+
+    def getStats(self) -> dict:
+        steps = max(self.frame_index, 1)
+        return {'name': self.name, 'frames': self.frame_index, 'late': self.late,
+                'step_ms': self.elapsed * 1000 / steps, 'dropped': self.capture.getDropped()}
+
+    def release(self):
+        self.capture.release()
+        self.control.close()
+        if self.telescopeEnabled:
+            print(f'{self.name} telescope commands: {self.telescope.getCommandStats()}')
+            self.telescope.stopTelescope()
+
+
+class Handoff:
+    """
+        :param source - the wide-field chain.
+        :param target - the narrow-field chain.
+        :param region - the (x1, y1, x2, y2) part of the source's working frame that the target camera sees.
+        :param min_size - the smallest side of a seeded box, in pixels of the target frame.
+    """
+
+    def __init__(self, source, target, region, min_size=20):
+        self.source = source
+        self.target = target
+        self.region = region
+        self.min_size = min_size
+        self.handoffs = 0
+
+    """
+        Seeds the target chain if the source tracks a target inside the region and the target doesn't.
+        Called between the steps of both chains, never while one of them runs.
+    """
+
+    def check(self):
+        if self.target.frame is None or not self.source.object_tracking.isTracking():
+            return
+        # the seed of the last handoff is used by the next step of the target
+        if self.target.object_tracking.isTracking() or self.target.object_tracking.seed_box is not None:
+            return
+
+        x, y = self.source.position
+        rx1, ry1, rx2, ry2 = self.region
+        if not (rx1 <= x < rx2 and ry1 <= y < ry2):
+            return
+
+        (height, width) = self.target.frame.shape[:2]
+        sx = width / (rx2 - rx1)
+        sy = height / (ry2 - ry1)
+        x1, y1, x2, y2 = self.source.object_tracking.getBox()
+        cx, cy = (x - rx1) * sx, (y - ry1) * sy
+        half_w = max((x2 - x1) * sx, self.min_size) / 2
+        half_h = max((y2 - y1) * sy, self.min_size) / 2
+        # a target near the edge of the region is cut to the target frame
+        box = (max(int(cx - half_w), 0), max(int(cy - half_h), 0),
+               min(int(cx + half_w), width), min(int(cy + half_h), height))
+        if box[2] - box[0] < 2 or box[3] - box[1] < 2:
+            return
+        self.target.object_tracking.seed(box)
+        self.handoffs += 1
+
+
+class Orchestrator:
+    """
+        :param chains - the Chain objects.
+        :param handoffs - the Handoff objects between them.
+        :param workers - the number of worker threads, one per chain by default
+                  (a chain never runs two steps at once, more workers than chains don't help).
+    """
+
+    def __init__(self, chains, handoffs=(), workers=None):
+        self.chains = list(chains)
+        self.handoffs = list(handoffs)
+        self.workers = workers or len(self.chains)
+        # the cores are divided between the workers, each OpenCV call uses its share
+        cv2.setNumThreads(max(1, (os.cpu_count() or 1) // self.workers))
+        self.condition = threading.Condition()
+        self.running = False
+
+    """
+        Runs the chains until all of them are over or stop() is called.
+    """
+
+    def run(self):
+        self.running = True
+        start = time.monotonic()
+        for chain in self.chains:
+            chain.due = start
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='Chain') as pool:
+            with self.condition:
+                while self.running:
+                    active = [chain for chain in self.chains if not chain.finished]
+                    if not active:
+                        break
+
+                    now = time.monotonic()
+                    self.checkHandoffs()
+                    free = self.workers - sum(chain.busy for chain in active)
+                    ready = [chain for chain in active if not chain.busy and chain.due <= now]
+                    ready.sort(key=lambda chain: (-chain.priority, chain.due))
+                    for chain in ready[:free]:
+                        self.submit(pool, chain, now)
+
+                    waiting = [chain.due for chain in active if not chain.busy and chain.due > now]
+                    self.condition.wait(timeout=min(waiting) - now if waiting else None)
+
+                # wait for the steps in flight before the chains are released
+                while any(chain.busy for chain in self.chains):
+                    self.condition.wait()
+
+        for chain in self.chains:
+            chain.release()
+
+    def submit(self, pool, chain, now):
+        if chain.period and now > chain.due + chain.period:
+            chain.late += 1
+        # a late chain isn't stepped twice to catch up, the next step is a period from now
+        chain.due = max(chain.due + chain.period, now) if chain.period else now
+        chain.busy = True
+        pool.submit(self.runStep, chain)
+
+    def runStep(self, chain):
+        try:
+            chain.step()
+        except Exception as error:
+            print(f'{chain.name}: failed, {error}')
+            chain.finished = True
+        finally:
+            with self.condition:
+                chain.busy = False
+                self.condition.notify_all()
+
+    def checkHandoffs(self):
+        for handoff in self.handoffs:
+            # the position and the box of the source are read between its steps, both of the same frame
+            if not handoff.target.busy and not handoff.target.finished and not handoff.source.busy:
+                handoff.check()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    """
+        :return the statistics of every chain and the number of handoffs.
+    """
+
+    def getStats(self) -> dict:
+        return {'chains': [chain.getStats() for chain in self.chains],
+                'handoffs': sum(handoff.handoffs for handoff in self.handoffs)}
+
+
+if __name__ == '__main__':
+    wide = Chain('wide', 'Videos/orange.mp4', fps=15, priority=0)
+    scope = Chain('scope', 'Videos/orange.mp4', fps=30, priority=1)
+    orchestrator = Orchestrator([wide, scope], [Handoff(wide, scope, region=(0, 0, 960, 540))])
+    orchestrator.run()
+    print(orchestrator.getStats())